@@ -7,12 +7,16 @@ from inspect import getmembers, isfunction, getdoc
 from importlib import import_module
 from ekpy.analysis.core import Data, Dataset
 import os
-import pandas as pd
-from ekpy.analysis.plotting import lane_martin
-import matplotlib.pyplot as plt
 import numpy as np
+import re
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
-def use_analysis_file(module, data, saveall=False, path=None, skip_func=None, verbose=False, dont_pass_defn=False):
+_SAVER_DIR_RE = re.compile(r'data_saver(\d+)')
+#module name -> (module spec, {function name: (func, func_appended, plotted_against, skip_plot)})
+_MODULE_CACHE = {}
+
+def use_analysis_file(module, data, saveall=False, path=None, skip_func=None, verbose=False, dont_pass_defn=False, skip_unmodifying=False, parallel=False, max_workers=None):
     """
     Reads correctly formatted analysis file and performs all functions in sequential order and returns the final mutated Data. Only want it to return the final
     mutated data alongside the original unless saveall=True
@@ -31,10 +35,16 @@ def use_analysis_file(module, data, saveall=False, path=None, skip_func=None, ve
         a warning appears
         verbose (Boolean): If set to true attempts to plot each step of the data analysis pathway
         dont_pass_defn (Boolean): Functions that do not use kwargs or defintion can pass this so you dont need to add kwargs (for legacy reasons)
+        skip_unmodifying (Boolean): If set to true functions whose doc_string has no MODIFIES: (e.g. plotting only functions) are not applied at all,
+        rather than applied to every trial and their output discarded
+        parallel (Boolean): If set to true each function is applied to batches of trials concurrently in a thread pool. Only use with functions
+        that operate on a single trial and are thread safe (numpy heavy functions benefit the most)
+        max_workers (int): Number of threads (and batches) to use when parallel is set. Defaults to os.cpu_count()
 
     Returns:
         data (ekpy.data or ekpy.dataset): The modified data or dataset.
-        data_saver (dict): A Dictionary containing all the intermediate steps of the data. (optional)
+        data_saver (dict): A Dictionary containing all the intermediate steps of the data. (optional) Unless saveall or verbose is set only the original
+        data (data0) and the final step are kept.
     """
     module = import_module(module)
     functions_list = list(module.__all__)
@@ -55,30 +65,33 @@ def use_analysis_file(module, data, saveall=False, path=None, skip_func=None, ve
     funcs_modified = ['original',]
     plotted_against_list = [None, ]
     skip_plot_list = [False, ]
+    #intermediate steps are only needed for plotting or saving, otherwise only keep data0 and the current step
+    keep_intermediate = saveall or verbose
+    prev_key = 'data0'
+    module_functions = _get_module_functions(module)
     for i, name in enumerate(functions_list):
-        func = getattr(module, name)
-        if dont_pass_defn:
+        func, func_appended, plotted_against, skip_plot = module_functions[name]
+        if skip_unmodifying and func_appended is None:
+            continue
+        if parallel:
+            check_if_func_nonetype = _parallel_apply(data, func, not dont_pass_defn, max_workers)
+        elif dont_pass_defn:
             check_if_func_nonetype = data.apply(func, pass_defn=False)
         else:
             check_if_func_nonetype = data.apply(func, pass_defn=True)
         if check_if_func_nonetype is None:
             continue
-        func_doc_str = getdoc(func)
-        func_appended, plotted_against, skip_plot = get_function_doc_append(func_doc_str)
         funcs_modified.append(func_appended)
         skip_plot_list.append(skip_plot)
         plotted_against_list.append(plotted_against)
         key_name = f"data{i + 1}"
         data_saver[key_name] = check_if_func_nonetype
+        if not keep_intermediate and prev_key != 'data0':
+            del data_saver[prev_key]
+        prev_key = key_name
         data = data_saver[key_name]
-    original_data = data_saver['data0'].to_dict()
-    last_data_added = data[data.data_keys[-1]]
-    if type(last_data_added) is dict:
-        for key in original_data.keys():
-            original_data[key]['data'][data.data_keys[-1]] = last_data_added[key]
-    else:
-        original_data[0]['data'][data.data_keys[-1]] = last_data_added 
-    data_out = Data(original_data)
+    last_data_key = data.data_keys[-1]
+    data_out = data_saver['data0'].with_column(last_data_key, data[last_data_key])
 
     if verbose:
         functions_list.insert(0, "Unmodified")
@@ -88,21 +101,32 @@ def use_analysis_file(module, data, saveall=False, path=None, skip_func=None, ve
         if path is None:
             print("Warning creating a directory since a path was not given")
             path = './'
-        path = path + '/data_saver0'
-        iterator = 1
-        while os.path.exists(path):
+        #one directory listing to find the next free data_saverN instead of checking each N
+        existing = []
+        if os.path.isdir(path):
+            for entry in os.scandir(path):
+                match = _SAVER_DIR_RE.fullmatch(entry.name)
+                if match is not None:
+                    existing.append(int(match.group(1)))
+        base_path = os.path.join(path, 'data_saver')
+        iterator = max(existing, default=-1) + 1
+        while True:
             if iterator > 1000:
                 raise ValueError("Dog make a new directory. you have over 1000 folders here or something messed up")
-            path = list(path)
-            path[-1] = str(iterator)
-            path = "".join(path)
-            iterator += 1
-        os.mkdir(path)
+            path = f'{base_path}{iterator}'
+            try:
+                os.makedirs(path, exist_ok=False)
+                break
+            except FileExistsError:
+                iterator += 1
         print("Folder %s created!" % path)
+        #writes are I/O bound so save the steps concurrently, then the meta data once they are all done
+        with ThreadPoolExecutor() as executor:
+            futures = [executor.submit(data_saver[keys].to_ekpdat, os.path.join(path, f'{keys}.ekpdat')) for keys in data_saver]
+            for future in futures:
+                future.result()
         meta_data_saver = Data({0: {'definition':0, 'data': {'funcs_modified': np.array(funcs_modified, dtype=str), 'plotted_against': np.array(plotted_against_list)}}})
-        meta_data_saver.to_ekpdat(path + '/saver.ekpdat')
-        for keys in data_saver:
-            data_saver[keys].to_ekpdat(path +f'\\{keys}'+'.ekpdat')
+        meta_data_saver.to_ekpdat(os.path.join(path, 'saver.ekpdat'))
     return data_out, data_saver
 
     
@@ -110,6 +134,78 @@ def use_analysis_file(module, data, saveall=False, path=None, skip_func=None, ve
 
 
 
+def _get_module_functions(module):
+    """
+    Helper function which returns the functions in module.__all__ alongside their parsed doc_string (see get_function_doc_append).
+    Cached per module so applying the same analysis file to many datasets only does the lookups once. A reloaded module is parsed again.
+
+    Args:
+        module (module): The imported analysis file
+    Returns:
+        functions (dict): {name: (func, func_name_appended, plotted_against, skip_plot)}
+    """
+    #importlib.reload re-executes into the same module object but assigns a new __spec__, so that is what identifies a stale entry
+    cached = _MODULE_CACHE.get(module.__name__)
+    if cached is not None and cached[0] is module.__spec__:
+        return cached[1]
+    functions = {}
+    for name in module.__all__:
+        func = getattr(module, name)
+        func_doc_str = getdoc(func)
+        if func_doc_str is None:
+            functions[name] = (func, None, None, False)
+        else:
+            functions[name] = (func,) + get_function_doc_append(func_doc_str)
+    _MODULE_CACHE[module.__name__] = (module.__spec__, functions)
+    return functions
+
+
+def _parallel_apply(data, func, pass_defn, max_workers=None):
+    """
+    Helper function which splits data into batches of trials, applies func to each batch in a thread pool and merges the results.
+    Matches data.apply(func, pass_defn=pass_defn) except that the result keeps the indices of data, returns None if func returned None
+    for any trial.
+
+    Args:
+        data (ekpy.Data): The data to apply func to
+        func (callable): The function to apply
+        pass_defn (Boolean): Passed to data.apply
+        max_workers (int): Number of threads and batches
+    Returns:
+        data (ekpy.Data): The merged result, or None
+    """
+    _dict = data.to_dict()
+    indices = list(_dict)
+    if len(indices) == 0:
+        return data.apply(func, pass_defn=pass_defn)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    #contiguous batches so the merged result keeps the order of data.apply
+    batch_size = max(1, -(-len(indices) // max_workers))
+    batches = [indices[i:i + batch_size] for i in range(0, len(indices), batch_size)]
+
+    def apply_batch(batch):
+        out = {}
+        for index in batch:
+            #one trial at a time so each result is known to belong to index, apply renumbers from 0 and drops a trial func errored on
+            result = Data({index:_dict[index]}).apply(func, pass_defn=pass_defn)
+            if result is None:
+                return None
+            for value in result.to_dict().values():
+                out[index] = value
+        return out
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(apply_batch, batches))
+    if any(result is None for result in results):
+        return None
+    merged = {}
+    for result in results:
+        merged.update(result)
+    return Data(merged)
+
+
+@lru_cache(maxsize=None)
 def get_function_doc_append(doc_string):
     """
     Helper function which takes in an appropiately formatted string and scans it for the appended value. See use_analysis_file for more
@@ -122,21 +218,17 @@ def get_function_doc_append(doc_string):
         plotted_against (str): The key that should be plotted against whatever was modified here, Returns None if not found
         skip_plot (boolean): Optional Flag that will suppress warnings if you have a function that doesn't need to show a plotting step
     """
-    if doc_string.find("MODIFIES:") != -1:
-        func_name_start = doc_string.find("MODIFIES:") + len("MODIFIES:")
-        func_name_appended = doc_string[func_name_start:].strip() 
-    else:
-        func_name_appended = None
-    if doc_string.find("PLOT_AGAINST:") != -1:
-        plotted_against_start = doc_string.find("PLOT_AGAINST:") + len("PLOT_AGAINST:")
-        plotted_against_end = doc_string[plotted_against_start:].find("\n")
-        plotted_against = doc_string[plotted_against_start:plotted_against_start+plotted_against_end].strip()
-    else:
-        plotted_against = None
-    if doc_string.find("SKIP_PLOT") != -1:
-        skip_plot = True
-    else:
-        skip_plot = False
+    func_name_appended, plotted_against, skip_plot = None, None, False
+    for line in doc_string.splitlines():
+        line = line.strip()
+        if line.startswith('MODIFIES:'):
+            if func_name_appended is None:
+                func_name_appended = line[len('MODIFIES:'):].strip()
+        elif line.startswith('PLOT_AGAINST:'):
+            if plotted_against is None:
+                plotted_against = line[len('PLOT_AGAINST:'):].strip()
+        if 'SKIP_PLOT' in line:
+            skip_plot = True
 
     return func_name_appended, plotted_against, skip_plot
     
@@ -154,16 +246,21 @@ def verbose_helper(data_saver, funcs_modified, plotted_against, functions_list,
     Returns:
         None
     """
+    #only needed when plotting, so not imported with the module
+    import matplotlib.pyplot as plt
+    from ekpy.analysis.plotting import lane_martin
+
     data_saver_list = list(data_saver.keys())
     for i, name in enumerate(data_saver_list):
         scatter = False
         data = data_saver[name] #we get the data starting with data0 the original data
+        data_keys = data.data_keys #property builds a new list each access
         func_modified = funcs_modified[i]
         if func_modified == 'original':
-            func_modified = data.data_keys[1]
+            func_modified = data_keys[1]
         plot_against = plotted_against[i]
         if plot_against is None:
-            plot_against = data.data_keys[0] #plots first element
+            plot_against = data_keys[0] #plots first element
 
         if skip_plot_list[i]:
             continue
@@ -174,17 +271,20 @@ def verbose_helper(data_saver, funcs_modified, plotted_against, functions_list,
             continue #go past this one in the list changed from pass
         
         #check to make sure that the plot_against is the same length as func_modifed
-        if type(data[plot_against]) is dict:
-            if len(data[func_modified][0]) != len(data[plot_against][0]): #check if first element of dictionary (which refers to each trial?) doesnt work note type should be array
-                indices = data[func_modified] #I need 2d array here
-                plot_against = data.data_keys[0]
-                func_modified = data.data_keys[1]
+        func_modified_values = data[func_modified]
+        plot_against_values = data[plot_against]
+        if type(plot_against_values) is dict:
+            if np.shape(func_modified_values[0])[0] != np.shape(plot_against_values[0])[0]: #check if first element of dictionary (which refers to each trial?) doesnt work note type should be array
+                indices = func_modified_values #I need 2d array here
+                plot_against = data_keys[0]
+                func_modified = data_keys[1]
                 scatter = True
         else:
-            if len(data[func_modified]) != len(data[plot_against]):
-                indices = np.array([data[func_modified]]) #this is numpy array for 1d case need to make 2d?
-                plot_against = data.data_keys[0]
-                func_modified = data.data_keys[1]
+            func_modified_values = np.asarray(func_modified_values)
+            if func_modified_values.shape[0] != np.shape(plot_against_values)[0]:
+                indices = func_modified_values[np.newaxis, :] #2d view for the 1d case, no copy
+                plot_against = data_keys[0]
+                func_modified = data_keys[1]
                 scatter = True
 
         #Setup plt ax and style
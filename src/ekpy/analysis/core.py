@@ -48,10 +48,8 @@ def _convert_ITP_to_path_to_index(index_to_path):
 	return {x:y.values for x,y in pd.Series(index_to_path.index, index = index_to_path.values).groupby(level=0)}
 
 def _check_file_exists(path, filename):
-	if filename in set(os.listdir(path)):
-		return True
-	else:
-		return False
+	# a stat instead of reading the whole directory
+	return os.path.exists(os.path.join(path, filename))
 
 
 def _remove_nans_from_set(set_to_remove_from):
@@ -957,7 +955,7 @@ class Data():
 			file (str): Path to file
 		"""
 		with open(file, 'wb') as f:
-			pickle.dump(self._dict, f)
+			pickle.dump(self._dict, f, protocol=pickle.HIGHEST_PROTOCOL)
 
 	def _get_indices_satisfying_definition_condition(self, condition):
 		"""need docstring"""
@@ -1165,6 +1163,35 @@ class Data():
 
 		return out
 
+	def with_column(self, data_key, values):
+		"""
+		Return a new Data with data_key set to values. Only the top-level dicts are copied, all other data is shared with self (not copied), and self is left unchanged.
+
+		args:
+			data_key (key): Data key to add or replace
+			values (numpy.array or dict): Values for data_key. If dict, values for each index in self (as returned by ``Data[data_key]`` for more than one index).
+
+		returns:
+			(Data): new Data
+
+		examples:
+
+			.. code-block:: python
+
+				>>> data.with_column('y_offset', data['y'] - 1)
+
+		"""
+		_dict_out = {}
+		for index in self._dict:
+			entry = dict(self._dict[index])
+			entry['data'] = dict(entry['data'])
+			if type(values) is dict:
+				entry['data'][data_key] = values[index]
+			else:
+				entry['data'][data_key] = values
+			_dict_out[index] = entry
+		return Data(_dict_out)
+
 	def apply(self, func:'callable', pass_defn:'bool'=False, pass_trials_iteratively:'bool'=True,
 		ignore_errors:'bool'=True, ignore_coerce_warnings:'bool'=True, **kwargs):
 		"""Apply data_function to the data in each index. ``**kwargs`` will be passed to data_function. If function_on_data returns 'None', that piece of data will be dropped. 
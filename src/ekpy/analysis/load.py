@@ -155,7 +155,7 @@ def generate_meta_data(path, mapper:'f(str)->dict', pass_path=False, pointercolu
 			generate_meta_data(path, mapper, pass_path=True)
 
 	"""
-	if 'meta_data.csv' in set(os.listdir(path)):
+	if os.path.exists(os.path.join(path, 'meta_data.csv')):
 		if not overwrite:
 			yn = input('this path ({}) already has meta_data.csv, do you wish to recreate it? (y/n)'.format(path))
 			if yn.lower() != 'y':
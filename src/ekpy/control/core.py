@@ -1,18 +1,54 @@
 import pandas as pd
 import numpy as np
 import time
-import itertools
 import warnings
 import pyvisa
 import os
-from IPython import display
+import pickle
+import threading
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from IPython import display, get_ipython
 
 from .misc import get_save_name
 from ..utils import write_ekpy_data
-from ..utils.save import _create_target_dir
 
 __all__ = ('trial','experiment')
 
+# meta_data.csv filename -> ((st_mtime_ns, st_size) after our last write, meta data DataFrame)
+_meta_data_cache = {}
+# trials run concurrently by n_param_scan(parallel=True) measure in parallel but save one at a time
+_save_lock = threading.Lock()
+
+class _StatusLine():
+	"""A single progress line. Under IPython it is updated in place, at most once every min_interval seconds, otherwise each update is printed."""
+
+	def __init__(self, min_interval=0.1):
+		self.min_interval = min_interval
+		self.handle = None
+		self.last_update = None
+		self.pending = None
+
+	def update(self, text, force=False):
+		if get_ipython() is None:
+			print(text)
+			return
+		now = time.monotonic()
+		if not force and self.last_update is not None and now - self.last_update < self.min_interval:
+			# shown by the next update or flush
+			self.pending = text
+			return
+		self.pending = None
+		self.last_update = now
+		if self.handle is None:
+			self.handle = display.display(display.Pretty(text), display_id=True)
+		else:
+			self.handle.update(display.Pretty(text))
+
+	def flush(self):
+		if self.pending is not None:
+			self.update(self.pending, force=True)
+
 class experiment():
 	
 	def __init__(self, run_function=None):
@@ -231,12 +267,28 @@ class experiment():
 
 		"""
 		self.run_function = run_function
+		self._save_counters = {}
 		if run_function is None:
 			warnings.showwarning("Returned from control.experiment.__init__ with run_function=None. Maybe, try using super().__init__(run_function) in __init__ definition? or ensure you have initialized run_function in subclass __init__", UserWarning, '', '')
 		return
 
 	def __repr__(self):
+		# no instrument queries here, this is called implicitly (e.g. by Jupyter), see describe
+		run_function = getattr(self, 'run_function', None)
+		return '<{} run_function={} path={}>'.format(type(self).__name__, getattr(run_function, '__name__', run_function), getattr(self, 'path', None))
+
+	def describe(self):
+		"""Return a description of the experiment with all of its attributes. GPIB instruments are shown by their `*idn?` response (queried once per instrument).
+
+		returns:
+			(str): Description
+
+		"""
 		out = self.__dict__.copy()
+		# id(instrument) -> (instrument, idn), so repeated reprs do not query the bus
+		idn_cache = out.pop('_idn_cache', {})
+		# internal bookkeeping for saving, not part of the experiment
+		out.pop('_save_counters', None)
 		try:
 			out.update({'run_function':self.run_function.__name__})
 		except:
@@ -246,14 +298,21 @@ class experiment():
 			#print out the actual instruments if we can
 			obj = out[key]
 			if type(obj) == pyvisa.resources.gpib.GPIBInstrument:
+				cached = idn_cache.get(id(obj))
+				if cached is not None and cached[0] is obj:
+					out.update({key:cached[1]})
+					continue
 				try:
-					out.update({key:obj.query("*idn?")})
+					idn = obj.query("*idn?")
+					idn_cache[id(obj)] = (obj, idn)
+					out.update({key:idn})
 				except:
 					pass
+		self._idn_cache = idn_cache
 		return out.__repr__()
 
 	def __str__(self):
-		return self.__repr__()
+		return self.describe()
 
 	def show_run_function_help(self):
 		"""Return help (used to view docstring/call args etc.) for `self.run_function`.
@@ -272,22 +331,50 @@ class experiment():
 
 		"""
 
-		success = False
-		original_path = path
-
-		try:
-			os.listdir(path)
+		if os.path.isdir(path):
 			yn = 'n'
-		except FileNotFoundError:
+		else:
 			yn = input("Path '{}' does not exist. Do you wish to create it? (y/n)".format(path))
 			yn = yn.lower()
 
 		if yn == 'y':
-			_create_target_dir(path)
+			# report the directories that are about to be made, deepest last
+			missing = []
+			target = os.path.abspath(path)
+			while not os.path.exists(target):
+				missing.append(target)
+				target = os.path.dirname(target)
+			for target in reversed(missing):
+				print('making dir {}'.format(target))
+			os.makedirs(path, exist_ok=True)
 		else:
 			pass
 		self.path = path
 
+	def _next_save_name(self, base_name, path):
+		"""Return a unique save name indexed by trial, as `get_save_name`. The directory is only scanned the first time a (path, base_name) is seen, after that the trial index is incremented.
+
+		args:
+			base_name (str): Base name of the trial
+			path (str): Save location.
+
+		returns:
+			save_name (str): A unique save name indexed by trial.
+
+		"""
+		if not hasattr(self, '_save_counters'):
+			# subclass did not call super().__init__
+			self._save_counters = {}
+		key = (path, base_name)
+		index = self._save_counters.get(key)
+		save_name = None if index is None else '{}_{}.csv'.format(base_name, index)
+		if save_name is None or os.path.exists(os.path.join(path, save_name)):
+			# first trial with this base_name here, or some other process wrote to path
+			save_name = get_save_name(base_name, path)
+			index = int(save_name.split('_')[-1].replace('.csv',''))
+		self._save_counters[key] = index + 1
+		return save_name
+
 	def checks(self, params):
 		"""Method to perform a set of checks on params before starting a scan. Default is simple pass."""
 		pass
@@ -339,7 +426,7 @@ class experiment():
 		raise NotImplementedError('_plot() should be overridden in experiment subclass. It is not.')
 
 
-	def n_param_scan(self, kw_scan_params, fixed_params, scan_param_order, ntrials=1, print_progress=True, plot=False):
+	def n_param_scan(self, kw_scan_params, fixed_params, scan_param_order, ntrials=1, print_progress=True, plot=False, parallel=False, max_workers=None, inter_trial_delay=1):
 		"""Perform a measurement over a set of params and save the data/meta data. 
 
 		args:
@@ -347,7 +434,11 @@ class experiment():
 			fixed_params (dict): Parameters to keep fixed.
 			scan_param_order (array-like): Order of scan parameters. 
 			ntrials (int): Number of trials to perform.
+			print_progress (bool): Show a status line with the current scan. It is updated in place in Jupyter and rate limited.
 			plot (bool): Plot as data is collected.
+			parallel (bool): Run trials concurrently in a thread pool. Only use this when run_function does not share a stateful instrument between trials (e.g. each scan point uses a different instrument).
+			max_workers (int): Number of threads to use when parallel is set. Defaults to `concurrent.futures.ThreadPoolExecutor` default.
+			inter_trial_delay (float): Time (s) to wait between trials. Ignored when parallel is set.
 
 
 		Examples:
@@ -385,61 +476,107 @@ class experiment():
 		params.update(fixed_params)
 		self.checks(params)
 
-		if not hasattr(self, 'terminate'):
-			raise NotImplementedError('no terminate function specified')
-		if not hasattr(self, 'run_function'):
-			raise AttributeError('run_function not yet defined.')
-		if self.run_function is None:
+		# terminate is always defined (on experiment), only run_function and path can be missing
+		if getattr(self, 'run_function', None) is None:
 			raise AttributeError('run_function not yet defined. run_function is currently None.')
 		if not hasattr(self, 'path'):
 			raise AttributeError('no save path defined.')
 			
-		if set(scan_param_order) != set(kw_scan_params.keys()):
-			raise KeyError('kw_scan_params do not have the same keys as scan_param_order')
+		mismatched_keys = set(scan_param_order) ^ set(kw_scan_params)
+		if mismatched_keys:
+			raise KeyError('kw_scan_params do not have the same keys as scan_param_order, mismatched keys: {}'.format(mismatched_keys))
+		status = _StatusLine() if print_progress else None
 		try:
+			not_array_like = next((key for key, params in kw_scan_params.items() if not hasattr(params, '__getitem__') or isinstance(params, str)), None)
+			if not_array_like is not None:
+				raise TypeError('kw_scan_param: {} must be array-like of params. it is not.'.format(not_array_like))
 			total_scans = int(np.prod([len(kw_scan_params[x]) for x in kw_scan_params])*ntrials)
 			iteration = 0
-			for key in kw_scan_params:
-				params = kw_scan_params[key]
-				if hasattr(params, '__getitem__') and type(params) != str:
-					pass
-				else:
-					raise TypeError('kw_scan_param: {} must be array-like of params. it is not.'.format(key))
-					
-			iterable_param_list = list(
-				itertools.product(
-					*(kw_scan_params[key] for key in scan_param_order[::-1])
-				)
-			)
-			
-			for params in iterable_param_list:
-				kwargs = fixed_params
+
+			scan_keys = list(scan_param_order[::-1])
+			value_lists = [kw_scan_params[key] for key in scan_keys]
+			shape = tuple(len(values) for values in value_lists)
+
+			# copy once so the caller's fixed_params is not modified, then only overwrite the scanned keys
+			kwargs = dict(fixed_params)
+			parallel_trials = []
+			for index in np.ndindex(*shape):
 				current_scan_params = {} # just the scanning params
-				for i, key in enumerate(scan_param_order[::-1]):
-					kwargs.update({key:params[i]})
-					current_scan_params.update({key:params[i]})
+				for key, values, i in zip(scan_keys, value_lists, index):
+					kwargs[key] = values[i]
+					current_scan_params[key] = values[i]
 				for count in range(ntrials):
+					if parallel:
+						parallel_trials.append((current_scan_params, dict(kwargs)))
+						continue
 					iteration += 1
-					print('Scan {} of {}. {}'.format(iteration, total_scans, current_scan_params))
+					if status is not None:
+						status.update('Scan {} of {}. {}'.format(iteration, total_scans, current_scan_params))
 					
-					trial_df = trial(self.run_function, kwargs, self.path, return_df=True)
+					trial_df = trial(self.run_function, kwargs, self.path, return_df=True, save_meta_data_pickle=False, save_name_provider=self._next_save_name)
 					if plot:
 						self._plot(trial_df, kwargs)
-					else:
-						display.clear_output(wait = True)
-					time.sleep(1)
+					time.sleep(inter_trial_delay)
 
-			return 
+			if parallel:
+				self._run_parallel_trials(parallel_trials, plot, max_workers, status)
 
 		except Exception as e:
 			print('terminating.')
+			# keep the legacy pickle for the trials that finished, without hiding e if that fails too
+			try:
+				self._write_meta_data_pickle()
+			except Exception as pickle_error:
+				print('could not write meta_data pickle: {}'.format(pickle_error))
 			raise e
 		finally:
+			if status is not None:
+				status.flush()
 			self.terminate()
-			print('done.')
-		
+		self._write_meta_data_pickle()
+		print('done.')
+		return 
+
+	def _write_meta_data_pickle(self):
+		"""Write the legacy meta_data pickle from meta_data.csv in self.path, once per scan rather than once per trial."""
+		existing_meta_data = _read_meta_data(self.path)
+		if existing_meta_data is not None:
+			existing_meta_data.to_pickle(os.path.join(self.path, 'meta_data'), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+	def _run_parallel_trials(self, parallel_trials, plot, max_workers=None, status=None):
+		"""Run trials in a thread pool for `n_param_scan`. Progress is shown (and plots updated) as trials complete.
+
+		args:
+			parallel_trials (list): List of (current_scan_params, run_function kwargs) for each trial
+			plot (bool): Plot as data is collected.
+			max_workers (int): Number of threads.
+			status (_StatusLine): Status line to show progress on, None for no progress.
 
-def trial(run_function, run_function_args, path, return_df=False, save_meta_data_pickle=True):
+		"""
+		total_scans = len(parallel_trials)
+		with ThreadPoolExecutor(max_workers=max_workers) as executor:
+			futures = {
+				executor.submit(trial, self.run_function, kwargs, self.path, return_df=True, save_meta_data_pickle=False, save_name_provider=self._next_save_name):(current_scan_params, kwargs)
+				for current_scan_params, kwargs in parallel_trials
+			}
+			try:
+				for iteration, future in enumerate(as_completed(futures), 1):
+					current_scan_params, kwargs = futures[future]
+					trial_df = future.result()
+					if status is not None:
+						status.update('Scan {} of {} complete. {}'.format(iteration, total_scans, current_scan_params))
+					if plot:
+						self._plot(trial_df, kwargs)
+			except BaseException:
+				# do not start any trials that have not yet begun
+				for future in futures:
+					future.cancel()
+				raise
+		return
+
+
+def trial(run_function, run_function_args, path, return_df=False, save_meta_data_pickle=True, save_name_provider=None):
 	"""
 	A trial for an experiment. This will save each trial (as csv) to path with a unique name (indexed by trial if an identical basename already exists). Also creates and saves meta data to path. The specified run_function must return ((str) base_name, (dict) meta_data, (pandas.dataframe) data).
 
@@ -452,18 +589,23 @@ def trial(run_function, run_function_args, path, return_df=False, save_meta_data
 		path (str): Save location.
 		return_df (bool): Return the resulting data (pandas.DataFrame)
 		save_meta_data_csv (bool): Save the meta_data as a pickle file in addition to .csv. This is carry over from a legacy version.
+		save_name_provider (callable): Called as save_name_provider(base_name, path) to get a unique save name. Defaults to `get_save_name`.
 	
 
 
 	"""
 	base_name, meta_data, df = run_function(**run_function_args)
-	try:
-		existing_meta_data = pd.read_csv(os.path.join(path, 'meta_data.csv'))
-	except FileNotFoundError:
-		existing_meta_data = None
+	with _save_lock:
+		return _save_trial(run_function, base_name, meta_data, df, path, return_df, save_meta_data_pickle, save_name_provider)
+
+def _save_trial(run_function, base_name, meta_data, df, path, return_df, save_meta_data_pickle, save_name_provider):
+	"""Save the output of a run_function for `trial`."""
+	existing_meta_data = _read_meta_data(path)
 
 	try:
-		save_name = get_save_name(base_name, path)
+		if save_name_provider is None:
+			save_name_provider = get_save_name
+		save_name = save_name_provider(base_name, path)
 		try: # attempt to get the trial number by looking at meta data, if any issues arise, increment the base_name by one and use that as trial number
 			query_str = _generate_meta_data_query_str(meta_data)
 			trial = _get_trial_number(existing_meta_data, query_str)
@@ -476,30 +618,59 @@ def trial(run_function, run_function_args, path, return_df=False, save_meta_data
 
 	meta_data.update({'trial':trial, 'filename':save_name})
 
-	assert type(df) == type(pd.DataFrame()), 'run_function {} does not return a pandas.DataFrame as its third return argument, it must'.format(run_function.__name__)
+	assert isinstance(df, pd.DataFrame), 'run_function {} does not return a pandas.DataFrame as its third return argument, it must'.format(run_function.__name__)
 
 	try:
 		write_ekpy_data(os.path.join(path,save_name), df, meta_data)
 	except:
-		# fall back to to_csv
-		df.to_csv(os.path.join(path,save_name), index=False)
+		# fall back to to_csv, rendered in memory and written in one go
+		data_to_write = df.to_csv(index=False)
+		with open(os.path.join(path,save_name), 'w', newline='') as f:
+			f.write(data_to_write)
 
 	#update the meta_data file in this directory
 	meta_data = pd.DataFrame(meta_data, index = [0])
 	if existing_meta_data is not None:
 		if set(meta_data.columns) != set(existing_meta_data.columns):
 			raise ValueError('the columns of meta_data do not match the existing columns of the data in this path ({}). Please ensure you are producing data of the same type, or move to a new path. Please note, your data was saved with file complete filename: {}, but it was not added to meta_data'.format(path, path+save_name))
-		out = pd.concat([existing_meta_data, meta_data], ignore_index = True)
-	else:
-		out = meta_data.copy()
+		meta_data = meta_data[existing_meta_data.columns]
 
-	out.to_csv(os.path.join(path,'meta_data.csv'), index = False)
+	out = _append_meta_data(path, meta_data, existing_meta_data)
 	if save_meta_data_pickle:
-		out.to_pickle(os.path.join(path,'meta_data'))
+		out.to_pickle(os.path.join(path,'meta_data'), protocol=pickle.HIGHEST_PROTOCOL)
 	if return_df:
 		return df
 
 
+def _read_meta_data(path):
+	"""Return the meta data (pandas.DataFrame) in path, or None if there is none. The file is only parsed if it changed since it was last written by trial."""
+	filename = os.path.join(path, 'meta_data.csv')
+	try:
+		stat = os.stat(filename)
+	except FileNotFoundError:
+		return None
+	cached = _meta_data_cache.get(filename)
+	if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+		return cached[1]
+	existing_meta_data = pd.read_csv(filename)
+	_meta_data_cache[filename] = ((stat.st_mtime_ns, stat.st_size), existing_meta_data)
+	return existing_meta_data
+
+def _append_meta_data(path, meta_data, existing_meta_data):
+	"""Append the single row meta_data (pandas.DataFrame, columns ordered as existing_meta_data) to meta_data.csv in path and return the full meta data."""
+	filename = os.path.join(path, 'meta_data.csv')
+	row = meta_data.to_csv(index=False, header=existing_meta_data is None)
+	with open(filename, 'a', newline='') as f:
+		f.write(row)
+	# parse the row back so the cached frame has the same dtypes as reading the file would give
+	if existing_meta_data is None:
+		out = pd.read_csv(StringIO(row))
+	else:
+		out = pd.concat([existing_meta_data, pd.read_csv(StringIO(row), header=None, names=list(existing_meta_data.columns))], ignore_index = True)
+	stat = os.stat(filename)
+	_meta_data_cache[filename] = ((stat.st_mtime_ns, stat.st_size), out)
+	return out
+
 def _generate_meta_data_query_str(meta_data):
 	query_str = ''
 	for key in meta_data:
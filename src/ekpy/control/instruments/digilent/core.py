@@ -8,6 +8,9 @@ import numpy as np
 
 __all__ = ('v_in', 'v_out', 'config_device', 'release_device')
 
+# board_num -> (ao_range, num_chans) of devices configured by config_device and not yet released
+_DEVICE_CACHE = {}
+
 
 def v_in(board_num, channel, ul_range=15, options=0):
     '''
@@ -24,15 +27,18 @@ def v_out(board_num, channel, data_value, ul_range=1, options=0):
 
 def release_device(board_num):
     '''
-    Wrapper for ul.release_daq_device
+    Wrapper for ul.release_daq_device, the next config_device call for board_num configures the device again
     '''
+    _DEVICE_CACHE.pop(board_num, None)
     ul.release_daq_device(board_num)
 
 
 def config_device(use_device_detection=True, dev_id_list=[],
                          board_num=0):
     '''
-    Configures the device and returns the accepted params from the device
+    Configures the device and returns the accepted params from the device. The device stays configured
+    until release_device is called, calling again with the same board_num returns the cached params
+    without detecting the device again
     Returns:
     list: list of channels
     int: num of channels
@@ -45,6 +51,9 @@ def config_device(use_device_detection=True, dev_id_list=[],
     # If use_device_detection is set to False, the board_num variable needs to
     # match the desired board number configured with Instacal.
 
+    if board_num in _DEVICE_CACHE:
+        return _DEVICE_CACHE[board_num]
+
     try:
         if use_device_detection:
             config_first_detected_device(board_num, dev_id_list)
@@ -62,6 +71,7 @@ def config_device(use_device_detection=True, dev_id_list=[],
         low_chan = 0
         high_chan = min(3, ao_info.num_chans - 1)
         num_chans = high_chan - low_chan + 1
+        _DEVICE_CACHE[board_num] = (ao_range, num_chans)
 
     except Exception as e:
         print('\n', e)
@@ -3,14 +3,37 @@ This is for the KEYSIGHT 81150A Arbitrary Pulse Generator and requires the KEYSI
 '''
 import numpy as np
 from typing import Union
-import struct
+import weakref
+import threading
+from functools import lru_cache
+from ....utils import join_scpi
+try:
+    from numba import njit
+except ImportError: # numba is optional, scale_waveform_data falls back to numpy
+    njit = None
 
 __all__ = ('idn', 'reset', 'initialize', 'configure_impedance', 'configure_output_amplifier', 'configure_trigger',
             'create_arb_wf_binary', 'configure_arb_wf', 'enable_output', 'send_software_trigger', 'stop', 'create_arb_wf',
             'set_output_wf', 'couple_channels',)
 
+#wavegen -> *idn? response, the identification never changes for an open resource
+_idn_cache = weakref.WeakKeyDictionary()
+#per thread float32/int16 buffers reused by create_arb_wf_binary across uploads
+_scratch = threading.local()
+
 def idn(wavegen):
-    return wavegen.query("*idn?")
+    """
+    Return the identification string of the wavegen. The instrument is only queried the first time for each resource.
+    args:
+        wavegen (pyvisa.resources.gpib.GPIBInstrument): Keysight 81150A
+    """
+    try:
+        return _idn_cache[wavegen]
+    except KeyError:
+        pass
+    response = wavegen.query("*idn?")
+    _idn_cache[wavegen] = response
+    return response
 
 
 def reset(wavegen):
@@ -28,8 +51,7 @@ def initialize(wavegen):
         wavegen (pyvisa.resources.gpib.GPIBInstrument): Keysight 81150A
     """
     
-    wavegen.write("*RST")
-    wavegen.write("*CLS")
+    wavegen.write("*RST;*CLS")
 
 def configure_impedance(wavegen, channel: str='1', source_impedance: str='50.0', load_impedance: str='50.0'):
     """
@@ -41,9 +63,11 @@ def configure_impedance(wavegen, channel: str='1', source_impedance: str='50.0',
         load_impedance (str): The desired load impedance in units of Ohms, allowed args are [0.3 to 1E6]
 
     """
-    wavegen.write(":OUTP{}:IMP {}".format(channel, source_impedance))
-    #wavegen.write(":OUTP{}:LOAD {}".format(channel, load_impedance)) Also valid for below
-    wavegen.write(":OUTP{}:IMP:EXT {}".format(channel, load_impedance))
+    #":OUTP{}:LOAD {}" is also valid for the load impedance
+    wavegen.write(join_scpi([
+        ":OUTP{}:IMP {}".format(channel, source_impedance),
+        ":OUTP{}:IMP:EXT {}".format(channel, load_impedance),
+    ]))
 
 def configure_output_amplifier(wavegen, channel: str='1', type: str='HIV'):
     """
@@ -65,9 +89,11 @@ def configure_trigger(wavegen, channel: str='1', source: str='IMM', mode: str='E
         mode (str): The type of triggering allowed args = [EDGE (edge), LEV (level)]
         slope (str): The slope of triggering allowed args = [POS (positive), NEG (negative), EIT (either)]
     """ 
-    wavegen.write(":ARM:SOUR{} {}".format(channel, source))
-    wavegen.write(":ARM:SENS{} {}".format(channel, mode))
-    wavegen.write(":ARM:SLOP {}".format(slope))
+    wavegen.write(join_scpi([
+        ":ARM:SOUR{} {}".format(channel, source),
+        ":ARM:SENS{} {}".format(channel, mode),
+        ":ARM:SLOP {}".format(slope),
+    ]))
 
 def create_arb_wf_binary(wavegen, data: Union[np.array, list], name: str='ARB1'):
     """
@@ -83,22 +109,24 @@ def create_arb_wf_binary(wavegen, data: Union[np.array, list], name: str='ARB1')
 
     args:
         wavegen (pyvisa.resources.gpib.GPIBInstrument): Keysight 81150A
-        data (ndarray or list): Data to be converted to wf
+        data (ndarray or list): Data to be converted to wf, 1d with 2 - 524288 points. Pass an ndarray to avoid a conversion
         name (str): Name of waveform, must start with A-Z
     """  
-    #will want to include error handling in this one.
-    data = np.array(data)
-    scaled_data = scale_waveform_data(data)
-    scaled_data = scaled_data.astype(np.int16)
-    size_of_data = str(2*len(scaled_data)) #multiply by 2 to account for negative values?
-    #want to send stuff accoprding to format whcih is #ABC
-    a = len(size_of_data.encode('utf-8')) 
-    b = size_of_data
-    #c is the binary data to be passed
-    c = scaled_data.tobytes()
-    #i think im done?
-    wavegen.write(":FORM:BORD NORM")
-    wavegen.write(":DATA:DAC VOLATILE, #{}{}{}".format(a,b,c))
+    #convert once to the float32 the scaling works in, no copy for float32 ndarrays
+    data = np.asarray(data, dtype=np.float32)
+    if data.ndim != 1 or not 2 <= data.shape[0] <= 524288:
+        raise ValueError('data must be 1d with 2 - 524288 points, got shape {}'.format(data.shape))
+    float_buffer, int_data = _get_scratch(data.shape[0])
+    scaled_data = scale_waveform_data(data, out=float_buffer)
+    #round to the nearest DAC code (astype alone truncates toward zero) and clip so float error cannot wrap
+    np.rint(scaled_data, out=scaled_data)
+    np.clip(scaled_data, -8191, 8191, out=scaled_data)
+    np.copyto(int_data, scaled_data, casting='unsafe')
+    scaled_data = int_data
+    #pyvisa builds the #ABC header and sends the samples as raw big endian int16 (2 bytes/sample),
+    #formatting the bytes into the command string would send their ascii repr instead.
+    #the byte order (NORM = big endian) is set in the same message as the block
+    wavegen.write_binary_values(":FORM:BORD NORM;:DATA:DAC VOLATILE, ", scaled_data, datatype='h', is_big_endian=True, header_fmt='ieee')
     wavegen.write(":DATA:COPY {}, VOLATILE".format(name))
 
 def create_arb_wf(wavegen, data, name=None):
@@ -115,11 +143,9 @@ def create_arb_wf(wavegen, data, name=None):
         data (ndarray or list): Data to be converted to wf
         name (str): Name of waveform, must start with A-Z
     """
-    data_string = ""
-    for i in range(len(data)):
-        data_string += str(data[i]) +','
-    data_string = data_string[:-1] #remove last comma
-    wavegen.write(":DATA VOLATILE, {}".format(data_string))
+    #join once instead of growing the string point by point, str keeps every sample's full precision
+    data_string = ','.join(map(str, data))
+    wavegen.write(":DATA VOLATILE, " + data_string)
     if name is not None:
         wavegen.write(":DATA:COPY {}, VOLATILE".format(name))
 
@@ -141,11 +167,13 @@ def configure_arb_wf(wavegen, channel: str='1', name='VOLATILE', gain: str='1.0'
         offset (str): The voltage offset in units of volts
         freq (str): the frequency in units of Hz for the arbitrary waveform
     """
-    wavegen.write(":FUNC{}:USER {}".format(channel, name)) #this had an error in it
-    wavegen.write(":FUNC{} USER".format(channel)) #this was put together like ":FUNC{}:USER {}:FUNC{} USER"
-    wavegen.write(":VOLT{} {}".format(channel, gain))
-    wavegen.write(":FREQ{} {}".format(channel, freq))
-    wavegen.write(":VOLT{}:OFFS {}".format(channel, offset))  
+    wavegen.write(join_scpi([
+        ":FUNC{}:USER {}".format(channel, name), #each command needs its own root ':' when chained (":FUNC{}:USER {}:FUNC{} USER" errored)
+        ":FUNC{} USER".format(channel),
+        ":VOLT{} {}".format(channel, gain),
+        ":FREQ{} {}".format(channel, freq),
+        ":VOLT{}:OFFS {}".format(channel, offset),
+    ]))
 
 def enable_output(wavegen, channel: str='1', on=True):
     """
@@ -155,18 +183,20 @@ def enable_output(wavegen, channel: str='1', on=True):
         channel (str): Desired Channel to configure accepted params are [1,2]
         on (boolean): True for on, False for off
     """
-    if on:
-        wavegen.write(":OUTP{} ON".format(channel))
-    else:
-        wavegen.write(":OUTP{} OFF".format(channel))
+    wavegen.write(_output_command(channel, on))
 
 def send_software_trigger(wavegen):
     """
-    This program sends the software trigger. Taken from LabVIEW. 
+    This program sends the software trigger. Taken from LabVIEW. The command is sent pre-encoded with write_raw
+    so triggering does no string handling.
     args:
         wavegen (pyvisa.resources.gpib.GPIBInstrument): Keysight 81150A
     """
-    wavegen.write(":TRIG")
+    if not hasattr(wavegen, 'write_raw'):
+        #e.g. an SCPIBatch, which only queues string commands
+        wavegen.write(":TRIG")
+        return
+    wavegen.write_raw(_raw_command(":TRIG", wavegen.write_termination, wavegen.encoding))
 
 def stop(wavegen):
     """Stop the scope.
@@ -219,16 +249,59 @@ def couple_channels(wavegen):
 Helper functions:
 '''
 
-def scale_waveform_data(data: np.array) -> np.array:
+def _get_scratch(n):
+    '''
+    Returns float32 and int16 buffers of length n for this thread, they are only reallocated when a longer waveform is seen
+    '''
+    float_buffer = getattr(_scratch, 'float_buffer', None)
+    if float_buffer is None or float_buffer.shape[0] < n:
+        _scratch.float_buffer = np.empty(n, dtype=np.float32)
+        _scratch.int_buffer = np.empty(n, dtype=np.int16)
+    return _scratch.float_buffer[:n], _scratch.int_buffer[:n]
+
+@lru_cache(maxsize=None)
+def _raw_command(command, termination, encoding):
+    '''
+    Returns command with termination encoded as pyvisa's write would, built once per resource settings
+    '''
+    return (command + (termination or '')).encode(encoding)
+
+@lru_cache(maxsize=None)
+def _output_command(channel, on):
+    '''
+    Returns the command to switch channel on or off, there are only a few so they are built once
+    '''
+    return ":OUTP{} {}".format(channel, 'ON' if on else 'OFF')
+
+def scale_waveform_data(data: np.array, out: np.array=None) -> np.array:
     '''
     Scales the data between -1 and 1 then multiplies by instrument specific
     scaling factor (8191 for ours) 
     NOTE THIS MAY NOT ACTUALLY WORK, AS YOU CAN JUST PASS THE DATA DIRECTLY AND SHOULD BE FROM -1 TO 1
+    out (ndarray): Optional contiguous float32 array with the shape of data to write the result into
     '''
-    normalized = 2*(data - np.min(data))/np.ptp(data) - 1
-    return normalized * 8191
+    #single affine map into a preallocated float32 array (the DAC is 14 bit so float32 is plenty)
+    data = np.asarray(data, dtype=np.float32)
+    if out is None:
+        out = np.empty(data.shape, dtype=np.float32)
+    data_min, data_max = data.min(), data.max()
+    if data_max == data_min:
+        raise ValueError('Cannot scale a constant waveform (all values are {}), it has no range to map onto -8191 to 8191'.format(data_min))
+    scale = np.float32(2*8191)/(data_max - data_min)
+    offset = np.float32(-8191) - data_min*scale
+    if _scale_kernel is not None and data.ndim == 1:
+        _scale_kernel(np.ascontiguousarray(data), scale, offset, out)
+        return out
+    np.multiply(data, scale, out=out)
+    np.add(out, offset, out=out)
+    return out
 
-size_of_data = str(16)
-#want to send stuff accoprding to format whcih is #ABC
-a = len(size_of_data.encode('utf-8'))
-print(a)
\ No newline at end of file
+if njit is not None:
+    #no fastmath, it allows reordering the arithmetic and the result has to match the numpy path exactly
+    @njit(cache=True)
+    def _scale_kernel(data, scale, offset, out):
+        #one pass writing the scaled output, same operations in the same order as the numpy fallback
+        for i in range(data.shape[0]):
+            out[i] = data[i]*scale + offset
+else:
+    _scale_kernel = None
@@ -0,0 +1,50 @@
+'''
+asyncio versions of the KEYSIGHT DSOX3024a functions in core. Each one runs the function of the same name in a worker thread
+(pyvisa releases the GIL while it waits on the instrument) so the event loop keeps running, e.g. to acquire from several scopes
+or a scope and a camera at the same time:
+
+    .. code-block:: python
+
+        from ekpy.control.instruments.keysightdsox3024a import async_core
+
+        data1, data2 = await asyncio.gather(async_core.acquire(scope1), async_core.acquire(scope2))
+
+Calls on the same scope are run one at a time, since a resource is not safe to use from more
+than one thread.
+'''
+import asyncio
+import functools
+import threading
+import weakref
+from . import core
+
+#generators and functions taking several scopes have no async version, see core.iter_acquire and core.setup_many
+__all__ = tuple(name for name in core.__all__ if name not in ('iter_acquire', 'setup_many'))
+
+#scope -> lock serializing the calls made on it
+_locks = weakref.WeakKeyDictionary()
+_locks_lock = threading.Lock()
+
+def _scope_lock(scope):
+    with _locks_lock:
+        lock = _locks.get(scope)
+        if lock is None:
+            lock = _locks[scope] = threading.Lock()
+        return lock
+
+def _to_async(func):
+    """Returns an async function which runs func(scope, ...) in the default executor while holding the scope's lock."""
+    def locked(scope, *args, **kwargs):
+        with _scope_lock(scope):
+            return func(scope, *args, **kwargs)
+
+    @functools.wraps(func)
+    async def wrapper(scope, *args, **kwargs):
+        #run_in_executor rather than asyncio.to_thread so python < 3.9 is supported
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, functools.partial(locked, scope, *args, **kwargs))
+    return wrapper
+
+for _name in __all__:
+    globals()[_name] = _to_async(getattr(core, _name))
+del _name
@@ -3,21 +3,60 @@
 This is for the KEYSIGHT DSOX3024a Oscilloscope and requires the KEYSIGHT I/O Libraries to function.
 '''
 import numpy as np
-import time
+import sys
+import weakref
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import pyvisa
+from ....utils import join_scpi
+try:
+    from numba import njit
+except ImportError: # numba is optional, acquire_finish falls back to numpy
+    njit = None
 
 __all__ = ('idn', 'reset','setup','acquire', 'initialize', 'configure_timebase', 'configure_channel', 'configure_scale', 
            'configure_trigger_characteristics', 'configure_trigger_edge', 'wait_for_acq_complete', 'error_query',
-             'setup_acquire', 'setup_wf', 'query_wf', 'query_wf_settings', 'query_increments', 'initiate',)
+             'setup_acquire', 'setup_wf', 'query_wf', 'query_wf_settings', 'query_increments', 'initiate',
+             'acquire_start', 'acquire_finish', 'acquire_all', 'wait_for_opc', 'make_fetcher', 'iter_acquire', 'setup_many',)
+
+#read size for waveform transfers, the pyvisa default (20 kB) splits a large waveform into many reads
+_BULK_CHUNK_SIZE = 1 << 20
+
+#scope -> *idn? response, the identification never changes for an open resource
+_idn_cache = weakref.WeakKeyDictionary()
+#scope -> count of writes that can change the waveform scaling, and scope -> (that count, preamble_dict) for query_wf(reuse_preamble=True)
+_settings_version = weakref.WeakKeyDictionary()
+_preamble_cache = weakref.WeakKeyDictionary()
+#allowed values, checked before anything is sent so a bad argument raises instead of ending up in the scope's error queue
+_channels = {'1', '2', '3', '4'}
+_couplings = {'AC', 'DC'}
+_impedances = {'ONEM', 'ONEMEG', 'FIFT', 'FIFTY'}
+#(preamble format, unsigned) -> query_binary_values datatype, format 0 is BYTE and 1 is WORD
+_binary_datatypes = {(0, False): 'b', (0, True): 'B', (1, False): 'h', (1, True): 'H'}
+#:WAVeform:BYTeorder matching this machine
+_HOST_BYTE_ORDER = 'LSBF' if sys.byteorder == 'little' else 'MSBF'
 
 def idn(scope):
-    return scope.query("*idn?")
+    """
+    Return the identification string of the scope. The instrument is only queried the first time for each resource.
+    args:
+        scope (pyvisa.resources.gpib.GPIBInstrument): Keysight DSOX3024a
+    """
+    try:
+        return _idn_cache[scope]
+    except KeyError:
+        pass
+    response = scope.query("*idn?")
+    _idn_cache[scope] = response
+    return response
 
 
 def reset(scope):
     scope.write("*RST")
+    _settings_changed(scope)
 
 def setup(scope, channel: str=1, voltage_range: str=16, voltage_offset: str=1.00, delay: str='100e-6',
-          time_range: str='1e-3', autoscale=True):
+          time_range: str='1e-3', autoscale=True, do_reset=True):
     """
     Sets up the oscilliscope with the given paramaters. If autoscale is turned on it will ignore
     all other arguments and simply autoscale the instrument. Otherwise sample paramters are given
@@ -31,16 +70,42 @@ def setup(scope, channel: str=1, voltage_range: str=16, voltage_offset: str=1.00
         voltage_offset (str): The offset for the voltage in units of volts
         delay (str): The delay in units of s
         time_range (str): The x scale of the oscilloscope, min 2ns, max 50s
+        do_reset (bool): Reset the instrument first. *RST reinitializes the whole front end which takes hundreds of ms,
+                         when calling setup repeatedly (e.g. in a sweep) after the first call, or right after initialize (which
+                         already sends *RST), pass False to only change the parameters
     """
-    reset(scope)
+    #the reset and settings go in one message, they are still executed in order
+    commands = ["*RST"] if do_reset else []
     if autoscale:
-        scope.write(":AUToscale")
+        commands.append(":AUToscale")
     else:
-        scope.write("CHANel{}:RANGe {}".format(channel, voltage_range))
-        scope.write("CHANel{}:OFFSet {}".format(channel, voltage_offset))
-        scope.write("CHANel{}:TIMebase:RANGe {}".format(channel, time_range))
-        scope.write("CHANel{}:TIMebase:DELay {}".format(channel, delay))
-    scope.write(":ACQuire:TYPE NORMal")
+        _check_channel(channel)
+        prefix = _channel_prefix(channel)
+        commands += [
+            prefix + "RANGe {}".format(voltage_range),
+            prefix + "OFFSet {}".format(voltage_offset),
+            prefix + "TIMebase:RANGe {}".format(time_range),
+            prefix + "TIMebase:DELay {}".format(delay),
+        ]
+    commands.append(":ACQuire:TYPE NORMal")
+    scope.write(join_scpi(commands))
+    _settings_changed(scope)
+
+def setup_many(scopes, **kwargs):
+    """
+    Runs setup on several scopes at once, one thread per scope, so the total time is that of the slowest scope rather than the
+    sum. Each scope must be its own resource, a resource is not safe to use from more than one thread.
+
+    args:
+        scopes (array-like): Keysight DSOX3024a resources
+        kwargs: Passed to setup
+    """
+    scopes = list(scopes)
+    if len(scopes) == 0:
+        return
+    with ThreadPoolExecutor(max_workers=len(scopes)) as executor:
+        #list() re-raises the first exception from a setup
+        list(executor.map(lambda scope: setup(scope, **kwargs), scopes))
 
 '''
 Below I am just remaking the LabVIEW program in python, or making my version of them, Note
@@ -49,13 +114,18 @@ inside the program I will say if it is just a copy else it is a substitute
 
 def initialize(scope):
     """
-    This program simply resets and clears the registry for the scope to make sure its ready to go
+    This program simply resets and clears the registry for the scope to make sure its ready to go. It also raises the
+    resource's read chunk_size so a whole waveform (e.g. an ASCii one) is read in one low level read instead of many
     args:
         scope (pyvisa.resources.gpib.GPIBInstrument): Keysight DSOX3024a
     """
-    
-    scope.write("*RST")
-    scope.write("*CLS")
+    #scope may be an SCPIBatch or SCPIShadow, the chunk size belongs to the resource they wrap
+    resource = getattr(scope, 'inst', scope)
+    chunk_size = getattr(resource, 'chunk_size', None)
+    if chunk_size is not None:
+        resource.chunk_size = max(chunk_size, _BULK_CHUNK_SIZE)
+    scope.write("*RST;*CLS")
+    _settings_changed(scope)
 
 
 def configure_timebase(scope, time_base_type="MAIN", position="0.0",
@@ -71,20 +141,20 @@ def configure_timebase(scope, time_base_type="MAIN", position="0.0",
         scale (str): The x scale of the scope in units of s/div min is 2ns, max is 50s
         vernier (boolean): Enables Vernier scale
     """
+    commands = []
     if time_base_type is not None:
-        scope.write("TIM:MODE {}".format(time_base_type))
+        commands.append("TIM:MODE {}".format(time_base_type))
     if position is not None:
-        scope.write("TIM:POS {}".format(position))
+        commands.append("TIM:POS {}".format(position))
     if range is not None:
-        scope.write("TIM:RANG {}".format(range))
+        commands.append("TIM:RANG {}".format(range))
     if reference is not None:
-        scope.write("TIM:REF {}".format(reference))
+        commands.append("TIM:REF {}".format(reference))
     if scale is not None:
-        scope.write("TIM:SCAL {}".format(scale))
-    if vernier:
-        scope.write("TIM:VERN ON")
-    else:
-        scope.write("TIM:VERN OFF")
+        commands.append("TIM:SCAL {}".format(scale))
+    commands.append("TIM:VERN {}".format('ON' if vernier else 'OFF'))
+    scope.write(join_scpi(commands))
+    _settings_changed(scope)
 
 
 def configure_channel(scope, channel: str='1', scale_mode=True, vertical_scale: str='5', vertical_range: str='40',
@@ -105,18 +175,25 @@ def configure_channel(scope, channel: str='1', scale_mode=True, vertical_scale:
         impedance (str): Configures if we are in high impedance mode or impedance match. Allowed factors are 'ONEM' for 1 M Ohm and 'FIFT' for 50 Ohm
         enable_channel (boolean): Enables the channel
     """
+    _check_channel(channel)
+    if str(coupling).upper() not in _couplings:
+        raise ValueError('Coupling "{}" not allowed. Please use one of {}'.format(coupling, _couplings))
+    if str(impedance).upper() not in _impedances:
+        raise ValueError('Impedance "{}" not allowed. Please use one of {}'.format(impedance, _impedances))
+    prefix = _channel_prefix(channel)
     if scale_mode:
-        scope.write("CHAN{}:SCAL {}".format(channel, vertical_scale))
-    else:
-        scope.write("CHAN{}:RANG {}".format(channel, vertical_range))
-    scope.write("CHAN{}:OFFS {}".format(channel, vertical_offset))
-    scope.write("CHAN{}:COUP {}".format(channel, coupling))
-    scope.write("CHAN{}:PROB {}".format(channel, probe_attenuation))
-    scope.write("CHAN{}:IMP {}".format(channel, impedance))
-    if enable_channel:
-        scope.write("CHAN{}:DISP ON".format(channel))
+        commands = [prefix + "SCAL {}".format(vertical_scale)]
     else:
-        scope.write("CHAN{}:DISP OFF".format(channel))
+        commands = [prefix + "RANG {}".format(vertical_range)]
+    commands += [
+        prefix + "OFFS {}".format(vertical_offset),
+        prefix + "COUP {}".format(coupling),
+        prefix + "PROB {}".format(probe_attenuation),
+        prefix + "IMP {}".format(impedance),
+        prefix + "DISP {}".format('ON' if enable_channel else 'OFF'),
+    ]
+    scope.write(join_scpi(commands))
+    _settings_changed(scope)
 
 def configure_scale(scope, channel: str='1', time_scale: str='0.0001', vertical_scale: str='5'):
     """Configures both the time scale and the vertical axis scale. Taken from
@@ -128,8 +205,10 @@ def configure_scale(scope, channel: str='1', time_scale: str='0.0001', vertical_
         time_scale (str): In units of sec/div
         vertical scale (str): in units of volts/div
     """
-    #scope.write(":TIM:SCAL {}".format(time_scale)) already done before...
-    scope.write(":CHAN{}:SCAL {}V".format(channel, vertical_scale)) #added V, delete comment if works
+    _check_channel(channel)
+    #both scales in one write
+    scope.write(join_scpi([":TIM:SCAL {}".format(time_scale), _channel_prefix(channel) + "SCAL {}V".format(vertical_scale)]))
+    _settings_changed(scope)
 
 def configure_trigger_characteristics(scope, type: str='EDGE', holdoff_time: str='4E-8', low_voltage_level: str='1',
                                       high_voltage_level: str='1', trigger_source: str='CHAN1', sweep: str='AUTO',
@@ -146,19 +225,15 @@ def configure_trigger_characteristics(scope, type: str='EDGE', holdoff_time: str
         enable_high_freq_filter (boolean): Toggles the high frequency filter
         enable_noise_filter (boolean): Toggles the noise filter
     """
-    if enable_high_freq_filter:
-        scope.write(":TRIG:HFR ON")
-    else:
-        scope.write(":TRIG:HFR OFF")
-    scope.write(":TRIG:HOLD {}".format(holdoff_time))
-    scope.write(":TRIG:LEV:HIGH {}, {}".format(high_voltage_level, trigger_source))
-    scope.write(":TRIG:LEV:LOW {}, {}".format(low_voltage_level, trigger_source))
-    scope.write(":TRIG:MODE {}".format(type))
-    if enable_noise_filter:
-        scope.write(":TRIG:NREJ ON")
-    else:
-        scope.write(":TRIG:NREJ OFF")
-    scope.write(":TRIG:SWE {}".format(sweep))
+    scope.write(join_scpi([
+        ":TRIG:HFR {}".format('ON' if enable_high_freq_filter else 'OFF'),
+        ":TRIG:HOLD {}".format(holdoff_time),
+        ":TRIG:LEV:HIGH {}, {}".format(high_voltage_level, trigger_source),
+        ":TRIG:LEV:LOW {}, {}".format(low_voltage_level, trigger_source),
+        ":TRIG:MODE {}".format(type),
+        ":TRIG:NREJ {}".format('ON' if enable_noise_filter else 'OFF'),
+        ":TRIG:SWE {}".format(sweep),
+    ]))
 
 def configure_trigger_edge(scope, trigger_source: str='CHAN1', input_coupling: str='AC', edge_slope: str='POS', 
                            level: str='0', filter_type: str='OFF'):
@@ -171,36 +246,57 @@ def configure_trigger_edge(scope, trigger_source: str='CHAN1', input_coupling: s
         level (str): Trigger level in volts
         filter_type (str): Allowed values = [OFF, LFR (High-pass filter), HFR (Low-pass filter)] Note: Low Frequency reject == High-pass
     """
-    scope.write(":TRIG:SOUR {}".format(trigger_source))
-    scope.write(":TRIG:COUP {}".format(input_coupling))
-    scope.write(":TRIG:LEV {}".format(level))
-    scope.write(":TRIG:REJ {}".format(filter_type))
-    scope.write(":TRIG:SLOP {}".format(edge_slope))
+    scope.write(join_scpi([
+        ":TRIG:SOUR {}".format(trigger_source),
+        ":TRIG:COUP {}".format(input_coupling),
+        ":TRIG:LEV {}".format(level),
+        ":TRIG:REJ {}".format(filter_type),
+        ":TRIG:SLOP {}".format(edge_slope),
+    ]))
 
 def wait_for_acq_complete(scope, timeout=100):
     """
     Ensures that the acquisition of data is complete. Taken from LabVIEW. 'Waits for the current waveform acquisition to finish,
-    This VI should be called after initiate and before fetch waveform'. Honestly, seems antiquated and seems simpler to use
-    *OPC? or *WAI Note in programming guide it says just use *OPC?
+    This VI should be called after initiate and before fetch waveform'. The LabVIEW version polls *STB? every 10 ms, as the
+    programming guide suggests this just uses *OPC? (see wait_for_opc) which returns as soon as the acquisition is done
     args:
         scope (pyvisa.resources.gpib.GPIBInstrument): Keysight DSOX3024a
         timeout (int): In units of 0.01 seconds
     """
     scope.write("*CLS")
-    scope.write("*OPC")
-    loop_count = 0
-    while True:
-        if loop_count > timeout:
-            print("Timed Out")
-            break
-        scope.write("*STB?")
-        status = int(scope.read())
-        binary = bin(status)[7] #checks of the index 5 bit is a 1 since bin goes like 0bxxxx
-        if binary == '1':
-            break
-        loop_count += 1
-        time.sleep(.01)
+    try:
+        wait_for_opc(scope, timeout=timeout*10)
+    except pyvisa.VisaIOError as error:
+        if error.error_code != pyvisa.constants.StatusCode.error_timeout:
+            raise
+        print("Timed Out")
         
+def wait_for_opc(scope, timeout=None):
+    """
+    Blocks until the scope has finished every command sent before it, with a single *OPC? query. Writes return without waiting
+    for the scope to apply them, so to configure several things send them all (e.g. with an SCPIBatch) and call this once at the end
+    instead of checking after each one.
+    args:
+        scope (pyvisa.resources.gpib.GPIBInstrument): Keysight DSOX3024a
+        timeout (int): Timeout for the query in ms, defaults to the resource's timeout. On a timeout the scope is cleared, so the
+                       late reply does not answer the next query, and the VisaIOError is raised
+    """
+    #scope may be an SCPIBatch or SCPIShadow, the query, timeout and device clear are the resource's they wrap. An SCPIBatch's
+    #commands are only sent on exit so they are not waited for
+    resource = getattr(scope, 'inst', scope)
+    old_timeout = resource.timeout
+    if timeout is not None:
+        resource.timeout = timeout
+    try:
+        resource.query("*OPC?")
+    except pyvisa.VisaIOError as error:
+        if error.error_code == pyvisa.constants.StatusCode.error_timeout:
+            #device clear flushes the output queue so the late reply does not answer the next query
+            resource.clear()
+        raise
+    finally:
+        resource.timeout = old_timeout
+
 def error_query(scope):
     """Queries the instrument for any errors. Taken from LabVIEW. 
     args:
@@ -228,13 +324,17 @@ def fetch_waveform(scope, channel: str='1', type: str='NORMal', bind_source_chan
     returns:
         data ()
     """ 
-    scope.write(":WAV:SOUR CHAN{}".format(channel))
+    commands = [":WAV:SOUR CHAN{}".format(channel)]
     if bind_source_channel == 'SUB0' or bind_source_channel == 'SUB1': #to ensure nothing else is passed
-        scope.write(":WAV:SOUR:SUB{}".format(bind_source_channel))
-    scope.write(":ACQuire:TYPE {}".format(type))
-    scope.write(":WAVeform:FORMat {}".format(format))
-    scope.write(":WAV:BYT MSBF;:WAV:FORM WORD;") #sets encoding to U16 for higher resolution
-    scope.write(":WAV:XOR?;:WAV:XINC?;:WAV:XREF?;:WAV:YOR?;:WAV:YINC?;:WAV:YREF?;")
+        commands.append(":WAV:SOUR:SUB{}".format(bind_source_channel))
+    commands += [
+        ":ACQuire:TYPE {}".format(type),
+        ":WAVeform:FORMat {}".format(format),
+        ":WAV:BYT MSBF", ":WAV:FORM WORD", #sets encoding to U16 for higher resolution
+        ":WAV:XOR?", ":WAV:XINC?", ":WAV:XREF?", ":WAV:YOR?", ":WAV:YINC?", ":WAV:YREF?",
+    ]
+    scope.write(join_scpi(commands))
+    _settings_changed(scope)
 
 def initiate(scope):
     """
@@ -245,8 +345,7 @@ def initiate(scope):
     args:
         scope (pyvisa.resources.gpib.GPIBInstrument): Keysight DSOX3024a
     """
-    scope.write(":DIG")
-    scope.write("*CLS")
+    scope.write(join_scpi([":DIG", "*CLS"]))
 
 '''
 end of labview copying
@@ -263,16 +362,20 @@ def setup_acquire(scope, complete=None, count=None, mode=None, averages=None, ty
         mode (str): Sets in real time or equivalent time [RTIMe, ETIMe]
         type (str): Allowed values are 'NORMal', 'AVERage', 'PEAK', and 'HRESolution' [high resolution]
     """ 
+    commands = []
     if complete is not None:
-        scope.write(":ACQuire:COMPlete {}".format(complete))
+        commands.append(":ACQuire:COMPlete {}".format(complete))
     if count is not None:
-        scope.write(":ACQuire:COUNt {}".format(count))
+        commands.append(":ACQuire:COUNt {}".format(count))
     if mode is not None:
-        scope.write(":ACQuire:MODE {}".format(mode))
+        commands.append(":ACQuire:MODE {}".format(mode))
     if averages is not None:
-        scope.write(":ACQuire:AVERages {}".format(averages))
+        commands.append(":ACQuire:AVERages {}".format(averages))
     if type is not None:
-        scope.write(":ACQuire:TYPE {}".format(type))
+        commands.append(":ACQuire:TYPE {}".format(type))
+    if len(commands) != 0:
+        scope.write(join_scpi(commands))
+        _settings_changed(scope)
 
 def setup_wf(scope, source: str='CHAN1', byte_order: str='MSBF', format: str='byte', points: str='1000', 
              points_mode: str='NORMal', unsigned: str='OFF'):
@@ -286,15 +389,18 @@ def setup_wf(scope, source: str='CHAN1', byte_order: str='MSBF', format: str='by
         points_mode (str): Mode for points allowed args are [NORM (normal), MAX (maximum), RAW]
         unsigned (str): Allows to switch between unsigned and signed integers [OFF (signed), ON (unsigned)]
     """ 
-    scope.write(":WAVeform:SOURce {}".format(source))
-    scope.write(":WAVeform:BYTeorder {}".format(byte_order))
-    scope.write(":WAVeform:FORMat {}".format(format))
-    scope.write(":WAVeform:POINts:MODE {}".format(points_mode))
-    scope.write(":WAVeform:POINts {}".format(points))
-    scope.write(":WAVeform:UNSigned {}".format(unsigned))
-
-
-def query_wf(scope, byte_order: str='MSBF', unsigned: str='OFF'):
+    scope.write(join_scpi([
+        ":WAVeform:SOURce {}".format(source),
+        ":WAVeform:BYTeorder {}".format(byte_order),
+        ":WAVeform:FORMat {}".format(format),
+        ":WAVeform:POINts:MODE {}".format(points_mode),
+        ":WAVeform:POINts {}".format(points),
+        ":WAVeform:UNSigned {}".format(unsigned),
+    ]))
+    _settings_changed(scope)
+
+
+def query_wf(scope, byte_order: str='MSBF', unsigned: str='OFF', reuse_preamble=False, out=None, dtype=np.float32):
     """Returns the specified channels waveform with averaging or not and of a specified format/count, call
     setup_wf first to intialize it correctly. This function only calls queries. First calls preamble to get
     data format. Then parses data and converts data to usable format.
@@ -317,54 +423,82 @@ def query_wf(scope, byte_order: str='MSBF', unsigned: str='OFF'):
         scope (pyvisa.resources.gpib.GPIBInstrument): Keysight DSOX3024a
         byte_order (str): Either MSBF (most significant byte first) or LSBF (least significant byte first)
         unsigned (str): Allows to switch between unsigned and signed integers [OFF (signed), ON (unsigned)]
+        reuse_preamble (bool): Skip the preamble query and reuse the one from the last call (or query_wf_settings) if none of the
+                               functions here that change the scaling (setup, reset, configure_timebase, configure_channel,
+                               setup_wf, acquire_start, ...) were called on scope since. Changes made any other way (front panel,
+                               an SCPIBatch, another resource) are not seen, only use it when there are none, e.g. in a sweep loop
+        out (ndarray): Optional float array to write wfm into, reuse it across calls to avoid allocating a new array each time.
+                       Must have at least as many points as are fetched
+        dtype (numpy dtype): dtype of the returned waveform when out is not given, see acquire
 
     returns:
         preamble_dict (dict) Dictionary with all params labeled. (MetaData)
-        time (list): Python list with all the scaled time (x_data array)
-        wfm (list): Python list with all the scaled y_values (y_data array) 
+        time (ndarray): All the scaled time (x_data array)
+        wfm (ndarray): All the scaled y_values (y_data array), a view of out if given
     """ 
-    preamble = scope.query(":WAVeform:PREamble?")
-    preamble1 = preamble.split()
-    preamble_list = preamble1[0].split(',')
-    preamble_dict = {
-    'format': np.int16(preamble_list[0]),
-    'type': np.int16(preamble_list[1]),
-    'points': np.int32(preamble_list[2]),
-    'count': np.int32(preamble_list[3]),
-    'x_increment': np.float64(preamble_list[4]),
-    'x_origin': np.float64(preamble_list[5]),
-    'x_reference': np.int32(preamble_list[6]),
-    'y_increment': np.float32(preamble_list[7]),
-    'y_origin': np.float32(preamble_list[8]),
-    'y_reference': np.int32(preamble_list[9]),
-    }
-    if byte_order == 'MSBF':
-        is_big_endian = True
-    if byte_order == 'LSBF':
-        is_big_endian = False
-    if unsigned == 'OFF':
-        is_unsigned = False
-    if unsigned == 'ON':
-        is_unsigned = True
-    if preamble_dict["format"] == 0 and not is_unsigned:
-        data = scope.query_binary_values("WAVeform:DATA?", datatype='b', is_big_endian=is_big_endian)
-    if preamble_dict["format"] == 0 and is_unsigned:
-        data = scope.query_binary_values("WAVeform:DATA?", datatype='B', is_big_endian=is_big_endian)
-    if preamble_dict["format"] == 1 and not is_unsigned:
-        data = scope.query_binary_values("WAVeform:DATA?", datatype='h', is_big_endian=is_big_endian)
-    if preamble_dict["format"] == 1 and is_unsigned:
-        data = scope.query_binary_values("WAVeform:DATA?", datatype='H', is_big_endian=is_big_endian)
+    if byte_order not in ('MSBF', 'LSBF'):
+        raise ValueError('Byte order "{}" not allowed. Please use MSBF or LSBF'.format(byte_order))
+    if unsigned not in ('OFF', 'ON'):
+        raise ValueError('Unsigned "{}" not allowed. Please use OFF or ON'.format(unsigned))
+    version = _settings_version.get(scope)
+    cached = _preamble_cache.get(scope)
+    if reuse_preamble and cached is not None and cached[0] == version:
+        preamble_dict = dict(cached[1])
+    else:
+        preamble_dict = _preamble_dict(scope.query(":WAVeform:PREamble?"))
+        _preamble_cache[scope] = (version, dict(preamble_dict))
     if preamble_dict["format"] == 4:
-        data = scope.query_ascii_values("WAVeform:DATA?")
-    time = []
-    wfm = []
-    for t in range(preamble_dict["points"]):
-        time.append((t* preamble_dict["x_increment"]) + preamble_dict["x_origin"])
-    for d in data:
-        wfm.append((d * preamble_dict["y_increment"]) + preamble_dict["y_origin"])
+        data = scope.query_ascii_values("WAVeform:DATA?", container=np.array)
+    else:
+        datatype = _binary_datatypes.get((int(preamble_dict["format"]), unsigned == 'ON'))
+        if datatype is None:
+            raise ValueError('unexpected waveform format {} in the preamble'.format(preamble_dict["format"]))
+        data = scope.query_binary_values("WAVeform:DATA?", container=np.array, datatype=datatype, is_big_endian=byte_order == 'MSBF',
+                                         chunk_size=_BULK_CHUNK_SIZE)
+    time = np.arange(preamble_dict["points"])*preamble_dict["x_increment"] + preamble_dict["x_origin"]
+    if out is None:
+        out = np.empty(data.shape[0], dtype=dtype)
+    elif out.shape[0] < data.shape[0]:
+        raise ValueError('out has {} points but {} were fetched'.format(out.shape[0], data.shape[0]))
+    #query_wf has always scaled without the y reference
+    wfm = _scale(data, 0, preamble_dict["y_increment"], preamble_dict["y_origin"], out[:data.shape[0]])
     return preamble_dict, time, wfm
 
-    
+
+
+def make_fetcher(scope, byte_order: str='MSBF', unsigned: str='OFF', dtype=np.float32):
+    """Returns a function that fetches the waveform in volts for repeated shots with fixed waveform settings, call setup_wf
+    (BYTE or WORD format) first. The preamble is queried once here and the datatype, byte order and scaling are fixed, so each
+    fetch is only the :WAVeform:DATA? query and one scaling pass into a buffer that is reused. Make a new fetcher after changing
+    anything that affects the scaling (e.g. setup_wf, the vertical scale or the timebase).
+
+    args:
+        scope (pyvisa.resources.gpib.GPIBInstrument): Keysight DSOX3024a
+        byte_order (str): The byte_order passed to setup_wf
+        unsigned (str): The unsigned passed to setup_wf
+        dtype (numpy dtype): dtype of the returned waveform
+    returns:
+        fetch (callable): fetch() returns the waveform in volts (ndarray). The array is overwritten by the next call, copy it to keep it
+    """
+    if byte_order not in ('MSBF', 'LSBF'):
+        raise ValueError('Byte order "{}" not allowed. Please use MSBF or LSBF'.format(byte_order))
+    if unsigned not in ('OFF', 'ON'):
+        raise ValueError('Unsigned "{}" not allowed. Please use OFF or ON'.format(unsigned))
+    preamble = _parse_preamble(scope.query(":WAVeform:PREamble?"))
+    datatype = _binary_datatypes.get((int(preamble[0]), unsigned == 'ON'))
+    if datatype is None:
+        raise ValueError('make_fetcher needs the BYTE or WORD format, the preamble has format {}'.format(int(preamble[0])))
+    is_big_endian = byte_order == 'MSBF'
+    y_increment, y_origin, y_reference = preamble[7:10]
+    buffer = np.empty(int(preamble[2]), dtype=dtype)
+
+    def fetch():
+        raw = scope.query_binary_values(":WAVeform:DATA?", datatype=datatype, is_big_endian=is_big_endian, container=np.array,
+                                        chunk_size=_BULK_CHUNK_SIZE)
+        if raw.shape[0] > buffer.shape[0]:
+            raise ValueError('fetched {} points but the preamble had {}, make a new fetcher'.format(raw.shape[0], buffer.shape[0]))
+        return _scale(raw, y_reference, y_increment, y_origin, buffer[:raw.shape[0]])
+    return fetch
 
 
 def query_wf_settings(scope):
@@ -386,9 +520,11 @@ def query_wf_settings(scope):
     args:
         scope (pyvisa.resources.gpib.GPIBInstrument): Keysight DSOX3024a
     returns:
-        preamble (str): See above for params"""
-
-    return scope.query(":WAVEFORM:PREAMBLE?")
+        preamble (str): See above for params. It is also kept for query_wf(reuse_preamble=True), so inspecting the settings
+                        and then fetching the waveform only queries the preamble once"""
+    preamble = scope.query(":WAVEFORM:PREAMBLE?")
+    _preamble_cache[scope] = (_settings_version.get(scope), _preamble_dict(preamble))
+    return preamble
 
 def query_increments(scope):
     """
@@ -401,12 +537,12 @@ def query_increments(scope):
     returns:
         x_increment, y_increment (tuple): x is in seconds usually, y is in volts usually
     """
-    x_increment = scope.query(":WAVeform:XINCrement?")
-    y_increment = scope.query(":WAVeform:YINCrement?")
+    #both queries in one message, the scope answers with the two responses separated by ';'
+    x_increment, y_increment = scope.query(join_scpi([":WAVeform:XINCrement?", ":WAVeform:YINCrement?"])).split(';')
     return x_increment, y_increment
 
 def acquire(scope, channel: str='1', type: str='NORMal', complete: str='100', count: str='10',
-            format: str='ASCii', points: str='500'):
+            format: str='WORD', points: str='500', out=None, dtype=np.float32):
     """Sets up the oscilliscope to acquire data and acquires it. Should run .setup() command first
 
 
@@ -417,18 +553,218 @@ def acquire(scope, channel: str='1', type: str='NORMal', complete: str='100', co
         voltage_offset (str): The offset for the voltage in units of volts
         delay (str): The delay in units of s
         time_range (str): The x scale of the oscilloscope, min 2ns, max 50s
+        format (str): Transfer format allowed args are [WORD (16bit), BYTE (8bit), ASCii]. WORD and BYTE are transferred as binary
+                      and scaled to volts on the host which is much smaller on the wire than ASCii
+        out (ndarray): Optional float array to write the scaled waveform into (binary formats only), reuse it across
+                       acquisitions to avoid allocating a new array each time. Must have at least as many points as are acquired
+        dtype (numpy dtype): dtype of the returned waveform when out is not given. float32 is far more precise than the scope's 8-16 bit
+                             samples and half the memory of float64, pass np.float64 if you need it
+    returns:
+        data (ndarray): The waveform in volts, a view of out if given
     """
-    scope.write(":ACQuire:TYPE {}".format(type))
-    scope.write(":ACQuire:COMPlete {}".format(complete))
-    scope.write(":ACQuire:COUNt {}".format(count))
-    scope.write(":DIGitize CHANnel{}".format(channel))
-    scope.write(":WAVeform:FORMat {}".format(format))
-    scope.write(":WAVeform:POINts {}".format(points))
+    acquire_start(scope, channel=channel, type=type, complete=complete, count=count, format=format, points=points)
+    return acquire_finish(scope, format=format, out=out, dtype=dtype)
+
+def acquire_start(scope, channel: str='1', type: str='NORMal', complete: str='100', count: str='10',
+                  format: str='WORD', points: str='500'):
+    """Sends the acquisition settings and starts digitizing, then returns without waiting for the scope. Do other work
+    (e.g. process the previous waveform) and then call acquire_finish with the same format to get the data. See acquire for args.
+
+    args:
+        scope (pyvisa.resources.gpib.GPIBInstrument): Keysight DSOX3024a
+    """
+    #the scope queues the commands after :DIGitize until it completes, the write itself does not wait
+    scope.write(join_scpi(_acquire_commands((channel,), type, complete, count, format, points)))
+    _settings_changed(scope)
+
+def acquire_finish(scope, format: str='WORD', out=None, dtype=np.float32):
+    """Waits for the acquisition started by acquire_start and returns the waveform in volts.
+
+    args:
+        scope (pyvisa.resources.gpib.GPIBInstrument): Keysight DSOX3024a
+        format (str): The format passed to acquire_start
+        out (ndarray): Optional float array to write the scaled waveform into, see acquire
+        dtype (numpy dtype): dtype of the returned waveform when out is not given, see acquire
+    returns:
+        data (ndarray): The waveform in volts, a view of out if given
+    """
+    if format.upper().startswith(('WORD', 'BYTE')):
+        #the y scaling depends on the format so it is queried now, the preamble has all of it in one query (see query_wf for the fields)
+        return _fetch_scaled(scope, format, _parse_preamble(scope.query(":WAVeform:PREamble?")), out, dtype)
     wf = scope.query("WAVeform:DATA?")
-    data = np.array([float(d) for d in wf[:-1].split(',')])
+    #numpy parses the whole list of strings in C, and like float() raises on a malformed value (np.fromstring would stop silently)
+    data = np.array(wf[:-1].split(','), dtype=dtype)
     return data
 
 
+def iter_acquire(scope, shots, channel: str='1', type: str='NORMal', complete: str='100', count: str='10',
+                 format: str='WORD', points: str='500', dtype=np.float32):
+    """Acquires shots waveforms one after the other, yielding each one. The next acquisition is started before a waveform is
+    yielded, so the scope digitizes shot N+1 while the caller processes shot N. The settings and the preamble are only sent and
+    read for the first shot, every following shot is a single :DIGitize and the data query. See acquire for the other args.
+
+    args:
+        scope (pyvisa.resources.gpib.GPIBInstrument): Keysight DSOX3024a
+        shots (int): Number of waveforms to acquire
+    yields:
+        data (ndarray): The waveform in volts
+    """
+    if shots <= 0:
+        return
+    acquire_start(scope, channel=channel, type=type, complete=complete, count=count, format=format, points=points)
+    binary = format.upper().startswith(('WORD', 'BYTE'))
+    #the acquisition and waveform settings stay set on the scope, so the scaling is the same for every shot
+    preamble = _parse_preamble(scope.query(":WAVeform:PREamble?")) if binary else None
+    for shot in range(shots):
+        if binary:
+            data = _fetch_scaled(scope, format, preamble, None, dtype)
+        else:
+            data = acquire_finish(scope, format=format, dtype=dtype)
+        if shot + 1 < shots:
+            _write_command(scope, ":DIGitize CHANnel{}".format(channel))
+        yield data
+
+def acquire_all(scope, channels=('1', '2', '3', '4'), type: str='NORMal', complete: str='100', count: str='10',
+                format: str='WORD', points: str='500', dtype=np.float32):
+    """Acquires several channels from a single acquisition. Calling acquire for each channel digitizes again every time,
+    this digitizes all of channels at once and then only transfers each channel's waveform. See acquire for the other args.
+
+    args:
+        scope (pyvisa.resources.gpib.GPIBInstrument): Keysight DSOX3024a
+        channels (array-like): Channels to acquire, allowed values are 1,2,3,4
+    returns:
+        data (dict): {channel: waveform in volts (ndarray)}
+    """
+    scope.write(join_scpi(_acquire_commands(channels, type, complete, count, format, points)))
+    _settings_changed(scope)
+    data = {}
+    for channel in channels:
+        #each channel has its own vertical scale so acquire_finish reads the preamble again after switching the source
+        _write_command(scope, ":WAVeform:SOURce CHANnel{}".format(channel))
+        data[channel] = acquire_finish(scope, format=format, dtype=dtype)
+    return data
+
+def _acquire_commands(channels, type, complete, count, format, points):
+    """Commands for acquire_start and acquire_all: the acquisition settings, :DIGitize of channels and the waveform transfer settings."""
+    for channel in channels:
+        _check_channel(channel)
+    #numeric settings are converted once here so a bad value raises before anything is sent, points may also be MAX/MAXimum
+    complete, count = int(complete), int(count)
+    if not str(points).upper().startswith('MAX'):
+        points = int(points)
+    commands = [
+        ":ACQuire:TYPE {}".format(type),
+        ":ACQuire:COMPlete {}".format(complete),
+        ":ACQuire:COUNt {}".format(count),
+        ":DIGitize {}".format(','.join("CHANnel{}".format(channel) for channel in channels)),
+        ":WAVeform:FORMat {}".format(format),
+        ":WAVeform:POINts {}".format(points),
+    ]
+    if format.upper().startswith(('WORD', 'BYTE')):
+        #signed samples in the host's byte order, so _query_binary_block can use them without swapping
+        commands += [":WAVeform:BYTeorder {}".format(_HOST_BYTE_ORDER), ":WAVeform:UNSigned OFF"]
+    return commands
+
+def _fetch_scaled(scope, format, preamble, out, dtype):
+    """Fetch the BYTE or WORD waveform and scale it to volts with preamble, see acquire_finish."""
+    y_increment, y_origin, y_reference = preamble[7:10]
+    raw = _query_binary_block(scope, np.int16 if format.upper().startswith('WORD') else np.int8)
+    if out is None:
+        out = np.empty(raw.shape[0], dtype=dtype)
+    elif out.shape[0] < raw.shape[0]:
+        raise ValueError('out has {} points but {} were acquired'.format(out.shape[0], raw.shape[0]))
+    return _scale(raw, y_reference, y_increment, y_origin, out[:raw.shape[0]])
+
+def _scale(raw, y_reference, y_increment, y_origin, out):
+    """Write (raw - y_reference)*y_increment + y_origin into out and return it. Each step is rounded to out's dtype, with the
+    numba kernel (if installed and raw is in native byte order) or numpy, and both give the same result."""
+    #out's dtype for the multiply and add, as numpy does with a python float and a float32 array
+    y_increment = out.dtype.type(y_increment)
+    y_origin = out.dtype.type(y_origin)
+    if _scale_kernel is not None and raw.dtype.isnative:
+        _scale_kernel(raw, y_reference, y_increment, y_origin, out)
+        return out
+    np.subtract(raw, y_reference, out=out)
+    np.multiply(out, y_increment, out=out)
+    np.add(out, y_origin, out=out)
+    return out
+
+def _query_binary_block(scope, dtype):
+    """Query :WAVeform:DATA? and return the IEEE 488.2 definite length block (#<n><length><data>) as an array of dtype in the
+    host's byte order. The block is read in one read_bytes call and wrapped with np.frombuffer, so unlike query_binary_values
+    the samples are not copied again and the result is read only."""
+    _write_command(scope, ":WAVeform:DATA?")
+    header = scope.read_bytes(2)
+    if header[:1] != b'#' or not header[1:2].isdigit() or header[1:2] == b'0':
+        raise ValueError('expected a definite length binary block, got {!r}'.format(header))
+    length = int(scope.read_bytes(int(header[1:2])))
+    #the block is followed by the termination character
+    payload = scope.read_bytes(length + 1, chunk_size=_BULK_CHUNK_SIZE)
+    return np.frombuffer(payload, dtype=dtype, count=length//np.dtype(dtype).itemsize)
+
+def _settings_changed(scope):
+    """Record that scope was sent something which can change the waveform scaling, a cached preamble is no longer used."""
+    _settings_version[scope] = _settings_version.get(scope, 0) + 1
+
+def _check_channel(channel):
+    """Raise ValueError if channel is not one of the scope's analog channels."""
+    if str(channel) not in _channels:
+        raise ValueError('Channel "{}" not allowed. Please use one of {}'.format(channel, _channels))
+
+@lru_cache(maxsize=None)
+def _channel_prefix(channel):
+    """Returns the ':CHAN<n>:' header prefix for channel, there are only four so each is built once."""
+    return ":CHAN{}:".format(channel)
+
+def _write_command(scope, command):
+    """Write a fixed command that is sent over and over (e.g. once per channel), pre-encoded with write_raw so it is only encoded once."""
+    if not hasattr(scope, 'write_raw'):
+        #e.g. an SCPIBatch, which only queues string commands
+        scope.write(command)
+        return
+    scope.write_raw(_raw_command(command, scope.write_termination, scope.encoding))
+
+@lru_cache(maxsize=None)
+def _raw_command(command, termination, encoding):
+    """Returns command with termination encoded as pyvisa's write would, built once per resource settings."""
+    return (command + (termination or '')).encode(encoding)
+
+def _preamble_dict(preamble):
+    """Parse the preamble response and label its fields for query_wf."""
+    preamble_list = _parse_preamble(preamble)
+    return {
+    'format': np.int16(preamble_list[0]),
+    'type': np.int16(preamble_list[1]),
+    'points': np.int32(preamble_list[2]),
+    'count': np.int32(preamble_list[3]),
+    'x_increment': np.float64(preamble_list[4]),
+    'x_origin': np.float64(preamble_list[5]),
+    'x_reference': np.int32(preamble_list[6]),
+    'y_increment': np.float32(preamble_list[7]),
+    'y_origin': np.float32(preamble_list[8]),
+    'y_reference': np.int32(preamble_list[9]),
+    }
+
+def _parse_preamble(preamble):
+    """Parse the :WAVeform:PREamble? response (see query_wf for the fields) into a float64 array in one numpy call."""
+    values = np.fromstring(preamble, sep=',', dtype=np.float64)
+    if values.shape[0] != 10:
+        #np.fromstring stops at the first value it cannot parse
+        raise ValueError('could not parse waveform preamble: {}'.format(preamble))
+    return values
+
+if njit is not None:
+    #no fastmath, it allows reordering the arithmetic and the result has to match the numpy path exactly
+    @njit(cache=True)
+    def _scale_kernel(raw, y_reference, y_increment, y_origin, out):
+        #subtract, multiply and add in one pass over the samples instead of three, see _scale
+        for i in range(raw.shape[0]):
+            out[i] = raw[i] - y_reference
+            out[i] = out[i]*y_increment + y_origin
+else:
+    _scale_kernel = None
+
+
 '''
 Note KEY commands in the programming guide are quite interesting to look at
 and allow you to program sequences of physical button presses.
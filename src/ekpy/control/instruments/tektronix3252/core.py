@@ -1,16 +1,156 @@
 from ....utils import (get_number_and_suffix,
     time_to_sci_mapper,
-    voltage_amp_mapper, 
+    voltage_amp_mapper,
     freq_mapper,
     )
 import numpy as np
+from functools import lru_cache
+import re
+import weakref
+from contextlib import contextmanager
 
 
 __all__ = ('start_pulse_gen', 'stop_pulse_gen', 'trigger', 'set_function_to_pulse',
-    'set_run_mode_to_burst', 'set_ncylces_for_burst_mode', 'set_offset', 'set_low_voltage', 
+    'set_run_mode_to_burst', 'set_ncylces_for_burst_mode', 'set_offset', 'set_low_voltage',
     'set_high_voltage', 'set_pulsewidth','set_polarity', 'set_frequency', 'set_pulse_delay',
-    'set_function_to_ramp','set_phase','set_amplitude', 'set_function_to_sine', 
-    'set_burst_mode_off')
+    'set_function_to_ramp','set_phase','set_amplitude', 'set_function_to_sine',
+    'set_burst_mode_off', 'pulse_gen_stopped')
+
+# Set to True for drivers/instruments that do not accept compound (';:' separated) SCPI messages.
+SEQUENTIAL_WRITES = False
+
+# Set to True to skip writes of settings to the value this module last sent them (e.g. the same pulsewidth on every step of a
+# sweep). Only writes made through this module are seen, so only use it when nothing else (front panel, *RST, another
+# resource) changes the instrument, or pass force=True after it does.
+SKIP_UNCHANGED_WRITES = False
+
+# SCPI templates for each setting, formatted with channel and value.
+_TEMPLATES = {
+    'delay':'SOURce{channel}:PULSe:DELay {value}',
+    'amplitude':'SOURce{channel}:VOLTage:LEVel:IMMediate:AMPLitude {value}',
+    'output_on':'OUTPut{channel}:STATe ON',
+    'output_off':'OUTPut{channel}:STATe OFF',
+    'phase':'SOURce{channel}:PHASe:ADJust {value}DEG',
+    'low_v':'SOURce{channel}:VOLTage:LEVel:IMMediate:low {value}',
+    'high_v':'SOURce{channel}:VOLTage:LEVel:IMMediate:high {value}',
+    'pulsewidth':'SOURce{channel}:PULSe:WIDTh {value}',
+    'frequency':'SOURce{channel}:FREQuency {value}',
+    'burst_on':'source{channel}:burst:state on',
+    'burst_off':'source{channel}:burst:state off',
+    'ncycles':'source{channel}:burst:ncycles {value}',
+    'pulse':'source{channel}:function:shape pulse',
+    'sine':'source{channel}:function:shape sin',
+    'ramp':'source{channel}:function:shape ramp',
+    'offset':'source{channel}:voltage:level:IMMediate:offset {value}',
+    'polarity':'output{channel}:polarity {value}',
+}
+
+# pulse_gen -> {(setting, channel): last value sent}, used to skip writes that would not change anything
+_last_state = weakref.WeakKeyDictionary()
+
+# settings which the instrument may change as a side effect of changing another setting
+_COUPLED_SETTINGS = {
+    'amplitude':('low_v', 'high_v', 'offset'),
+    'low_v':('offset',),
+    'high_v':('offset',),
+    'offset':('low_v', 'high_v'),
+    'frequency':('pulsewidth',),
+}
+
+_VOLT_RE = re.compile(r'\s*([-+]?(?:\d+\.?\d*|\.\d+))\s*(mv|kv|v)?\s*', re.IGNORECASE)
+
+_MAPPERS = {
+    'time':time_to_sci_mapper,
+    'frequency':freq_mapper,
+}
+
+def _write(pulse_gen, *commands):
+    """Write commands to the pulse generator. Unless SEQUENTIAL_WRITES is set, commands are sent as
+    a single compound SCPI message (one GPIB transaction).
+
+    args:
+        pulse_gen (pyvisa.resources.gpib.GPIBInstrument): Tektronix AFG 3252
+        *commands (str): SCPI commands
+
+    """
+    if SEQUENTIAL_WRITES:
+        for command in commands:
+            pulse_gen.write(command)
+    else:
+        pulse_gen.write(';:'.join(commands))
+    return
+
+def _check_channel(channel):
+    """Internal function to make sure channel is an integer (python or numpy)."""
+    if not isinstance(channel, (int, np.integer)):
+        raise TypeError('channel must be type int. Recieved type: {}'.format(type(channel)))
+    return
+
+def _commands(key, channel, both, value=None):
+    """Return the SCPI commands for setting key on channel (or both channels)."""
+    template = _TEMPLATES[key]
+    if both:
+        return (template.format(channel=1, value=value), template.format(channel=2, value=value))
+    return (template.format(channel=channel, value=value),)
+
+def _unchanged(pulse_gen, key, value, channel, both):
+    """Return True if value was the last value sent for key on channel (or both channels). Always False unless SKIP_UNCHANGED_WRITES is set."""
+    if not SKIP_UNCHANGED_WRITES:
+        return False
+    try:
+        state = _last_state.get(pulse_gen, {})
+    except TypeError: # pulse_gen cannot be weakly referenced, no tracking
+        return False
+    channels = (1, 2) if both else (channel,)
+    return all((key, ch) in state and state[(key, ch)] == value for ch in channels)
+
+def _remember(pulse_gen, key, value, channel, both):
+    """Record value as the last value sent for key on channel (or both channels). Nothing is recorded unless SKIP_UNCHANGED_WRITES is set."""
+    if not SKIP_UNCHANGED_WRITES:
+        return
+    try:
+        state = _last_state.setdefault(pulse_gen, {})
+    except TypeError:
+        return
+    for ch in ((1, 2) if both else (channel,)):
+        for coupled in _COUPLED_SETTINGS.get(key, ()):
+            state.pop((coupled, ch), None)
+        if value is None:
+            state.pop((key, ch), None)
+        else:
+            state[(key, ch)] = value
+    return
+
+def _forget(pulse_gen, channel, both):
+    """Forget every value sent on channel (or both channels), e.g. after changing the function which can change all of them."""
+    try:
+        state = _last_state.get(pulse_gen)
+    except TypeError:
+        return
+    if state is None:
+        return
+    channels = (1, 2) if both else (channel,)
+    for setting in [setting for setting in state if setting[1] in channels]:
+        del state[setting]
+    return
+
+@lru_cache(maxsize=256)
+def _to_sci_str(value, mapper_name):
+    """Convert e.g. '1us' to '1.0e-6' using the mapper named mapper_name. Cached as the same
+    values recur across a sweep."""
+    mapper = _MAPPERS[mapper_name]
+    number, suffix = get_number_and_suffix(value)
+    return str(number) + mapper[suffix]
+
+@lru_cache(maxsize=512)
+def _format_voltage(voltage):
+    """Convert a voltage string to its SCPI value, e.g. '10mV' -> '10.0e-3'. Cached as the same
+    voltages recur across a sweep."""
+    match = _VOLT_RE.fullmatch(voltage)
+    if match is None:
+        raise ValueError('unable to find a valid voltage in str: {}'.format(voltage))
+    number, suffix = match.groups()
+    return str(float(number)) + voltage_amp_mapper[(suffix or '').lower()]
 
 def set_pulse_delay(pulse_gen, delay:str, channel=1, both=False):
     """Specify the delay for channel in pulse mode.
@@ -19,20 +159,12 @@ def set_pulse_delay(pulse_gen, delay:str, channel=1, both=False):
         pulse_gen (pyvisa.resources.gpib.GPIBInstrument): Tektronix AFG 3252
         delay (str): Delay. Example '1us'
         channel (int): Which channel.
-        both (bool): Set for both channels. 
-
-    """   
-
-    f = delay.lower()
-    f_number, f_suffix = get_number_and_suffix(f) 
-    f = str(f_number) + time_to_sci_mapper[f_suffix]
+        both (bool): Set for both channels.
 
-    if both:
-        pulse_gen.write('SOURce1:PULSe:DELay {}'.format(f))
-        pulse_gen.write('SOURce2:PULSe:DELay {}'.format(f))
-    else:
-        pulse_gen.write('SOURce{}:PULSe:DELay {}'.format(channel, f))
+    """
 
+    f = _to_sci_str(delay.lower(), 'time')
+    _write(pulse_gen, *_commands('delay', channel, both, f))
     return
 
 def set_amplitude(pulse_gen, amplitude:str, channel=1, both=False):
@@ -42,19 +174,13 @@ def set_amplitude(pulse_gen, amplitude:str, channel=1, both=False):
         pulse_gen (pyvisa.resources.gpib.GPIBInstrument): Tektronix AFG 3252
         amplitude (str): Delay. Example '10mV'
         channel (int): Which channel.
-        both (bool): Set for both channels. 
-
-    """   
-
-    v_number, v_suffix = get_number_and_suffix(amplitude)
-    amp = str(v_number) + voltage_amp_mapper[v_suffix]
+        both (bool): Set for both channels.
 
-    if both:
-        pulse_gen.write('SOURce1:VOLTage:LEVel:IMMediate:AMPLitude {}'.format(amp))
-        pulse_gen.write('SOURce2:VOLTage:LEVel:IMMediate:AMPLitude {}'.format(amp))
-    else:
-        pulse_gen.write('SOURce{}:VOLTage:LEVel:IMMediate:AMPLitude {}'.format(channel, amp))
+    """
 
+    amp = _format_voltage(amplitude)
+    _write(pulse_gen, *_commands('amplitude', channel, both, amp))
+    _remember(pulse_gen, 'amplitude', None, channel, both)
     return
 
 def start_pulse_gen(pulse_gen, channel=1, both=False):
@@ -67,14 +193,9 @@ def start_pulse_gen(pulse_gen, channel=1, both=False):
         both (bool): Turn on both channels
 
     """
-    if type(channel) != int:
-        raise TypeError('channel must be type int. Recieved type: {}'.format(type(channel)))
+    _check_channel(channel)
 
-    if both:
-        pulse_gen.write('OUTPut1:STATe ON')
-        pulse_gen.write('OUTPut2:STATe ON')
-    else:
-        pulse_gen.write('OUTPut{}:STATe ON'.format(channel))
+    _write(pulse_gen, *_commands('output_on', channel, both))
     return
 
 def set_phase(pulse_gen, phase:float, channel=1, both=False):
@@ -88,14 +209,9 @@ def set_phase(pulse_gen, phase:float, channel=1, both=False):
         both (bool): Turn on both channels
 
     """
-    if type(channel) != int:
-        raise TypeError('channel must be type int. Recieved type: {}'.format(type(channel)))
+    _check_channel(channel)
 
-    if both:
-        pulse_gen.write('SOURce1:PHASe:ADJust {}DEG'.format(phase))
-        pulse_gen.write('SOURce2:PHASe:ADJust {}DEG'.format(phase))
-    else:
-        pulse_gen.write('SOURce{}:PHASe:ADJust {}DEG'.format(channel, phase))
+    _write(pulse_gen, *_commands('phase', channel, both, phase))
     return
 
 def stop_pulse_gen(pulse_gen, channel=1, both=False):
@@ -108,85 +224,97 @@ def stop_pulse_gen(pulse_gen, channel=1, both=False):
         both (bool): Turn off both channels
 
     """
-    if type(channel) != int:
-        raise TypeError('channel must be type int. Recieved type: {}'.format(type(channel)))
+    _check_channel(channel)
 
-    if both:
-        pulse_gen.write('OUTPut1:STATe OFF')
-        pulse_gen.write('OUTPut2:STATe OFF')
-    else:
-        pulse_gen.write('OUTPut{}:STATe OFF'.format(channel))
+    _write(pulse_gen, *_commands('output_off', channel, both))
     return
 
-def set_low_voltage(pulse_gen, low_v, channel = 1, both = False):
-    """Specify the low voltage for the pulse generator. 
+@contextmanager
+def pulse_gen_stopped(pulse_gen, channel = 1, both = False):
+    """Context manager that stops the pulse generator once on entry, so several settings can be
+    changed without stopping for each. Output is not restarted on exit; use `start_pulse_gen`.
 
     args:
         pulse_gen (pyvisa.resources.gpib.GPIBInstrument): Tektronix AFG 3252
-        low_v (str): Low voltage. Example '0V'
-        channel (int): Which channel.
-        both (bool): Set high voltage and pulsewidth for both channels. 
+        channel (int): 1 or 2. Which channel to turn off
+        both (bool): Turn off both channels
+
+    examples:
+
+        .. code-block:: python
+
+            with pulse_gen_stopped(pulse_gen, both=True):
+                set_low_voltage(pulse_gen, '0V', both=True, stop=False)
+                set_high_voltage(pulse_gen, '1V', both=True, stop=False)
+            start_pulse_gen(pulse_gen, both=True)
 
     """
     stop_pulse_gen(pulse_gen, channel = channel, both = both)
+    yield pulse_gen
 
-    low_v = low_v.lower()
-    v_number, v_suffix = get_number_and_suffix(low_v)
-    low_v = str(v_number) + voltage_amp_mapper[v_suffix]
+def set_low_voltage(pulse_gen, low_v, channel = 1, both = False, stop = True, force = False):
+    """Specify the low voltage for the pulse generator.
 
-    if both:
-        pulse_gen.write('SOURce1:VOLTage:LEVel:IMMediate:low {}'.format(low_v))
-        pulse_gen.write('SOURce2:VOLTage:LEVel:IMMediate:low {}'.format(low_v))
-    else:
-        pulse_gen.write('SOURce{}:VOLTage:LEVel:IMMediate:low {}'.format(channel, low_v))
+    args:
+        pulse_gen (pyvisa.resources.gpib.GPIBInstrument): Tektronix AFG 3252
+        low_v (str): Low voltage. Example '0V'
+        channel (int): Which channel.
+        both (bool): Set high voltage and pulsewidth for both channels.
+        stop (bool): Stop the output before setting (sent in the same message). Use False if the output is already stopped, e.g. inside `pulse_gen_stopped`.
+        force (bool): Write even if value is the same as the last value sent by this module (e.g. after a reset or front panel change).
 
+    """
+    _check_channel(channel)
+    low_v = _format_voltage(low_v)
+    unchanged = not force and _unchanged(pulse_gen, 'low_v', low_v, channel, both)
+    commands = () if unchanged else _commands('low_v', channel, both, low_v)
+    if stop:
+        commands = _commands('output_off', channel, both) + commands
+    if commands:
+        _write(pulse_gen, *commands)
+    _remember(pulse_gen, 'low_v', low_v, channel, both)
     return
 
-def set_high_voltage(pulse_gen, high_v, channel = 1, both = False):
-    """Specify the high voltage for the pulse generator. 
+def set_high_voltage(pulse_gen, high_v, channel = 1, both = False, stop = True, force = False):
+    """Specify the high voltage for the pulse generator.
 
     args:
         pulse_gen (pyvisa.resources.gpib.GPIBInstrument): Tektronix AFG 3252
         high_v (str): High voltage. Example '1V'
         channel (int): Which channel.
-        both (bool): Set high voltage for both channels. 
+        both (bool): Set high voltage for both channels.
+        stop (bool): Stop the output before setting (sent in the same message). Use False if the output is already stopped, e.g. inside `pulse_gen_stopped`.
+        force (bool): Write even if value is the same as the last value sent by this module (e.g. after a reset or front panel change).
 
     """
-    stop_pulse_gen(pulse_gen, channel = channel, both = both)
-
-    high_v = high_v.lower()
-    v_number, v_suffix = get_number_and_suffix(high_v)
-    high_v = str(v_number) + voltage_amp_mapper[v_suffix]
-
-    if both:
-        pulse_gen.write('SOURce1:VOLTage:LEVel:IMMediate:high {}'.format(high_v))
-        pulse_gen.write('SOURce2:VOLTage:LEVel:IMMediate:high {}'.format(high_v))
-    else:
-        pulse_gen.write('SOURce{}:VOLTage:LEVel:IMMediate:high {}'.format(channel, high_v))
-
+    _check_channel(channel)
+    high_v = _format_voltage(high_v)
+    unchanged = not force and _unchanged(pulse_gen, 'high_v', high_v, channel, both)
+    commands = () if unchanged else _commands('high_v', channel, both, high_v)
+    if stop:
+        commands = _commands('output_off', channel, both) + commands
+    if commands:
+        _write(pulse_gen, *commands)
+    _remember(pulse_gen, 'high_v', high_v, channel, both)
     return
 
-def set_pulsewidth(pulse_gen, pw, channel = 1, both = False):
+def set_pulsewidth(pulse_gen, pw, channel = 1, both = False, force = False):
     """Specify the pulse width.
 
     args:
         pulse_gen (pyvisa.resources.gpib.GPIBInstrument): Tektronix AFG 3252
         pw (str): Pulsewidth. Example '1ms'
         channel (int): Which channel.
-        both (bool): Set pulsewidth for both channels. 
+        both (bool): Set pulsewidth for both channels.
+        force (bool): Write even if value is the same as the last value sent by this module (e.g. after a reset or front panel change).
 
-    """   
-
-    pw = pw.lower()
-    pw_number, pw_suffix = get_number_and_suffix(pw) 
-    pw = str(pw_number) + time_to_sci_mapper[pw_suffix]
-
-    if both:
-        pulse_gen.write('SOURce1:PULSe:WIDTh {}'.format(pw))
-        pulse_gen.write('SOURce2:PULSe:WIDTh {}'.format(pw))
-    else:
-        pulse_gen.write('SOURce{}:PULSe:WIDTh {}'.format(channel, pw))
+    """
 
+    pw = _to_sci_str(pw.lower(), 'time')
+    if not force and _unchanged(pulse_gen, 'pulsewidth', pw, channel, both):
+        return
+    _write(pulse_gen, *_commands('pulsewidth', channel, both, pw))
+    _remember(pulse_gen, 'pulsewidth', pw, channel, both)
     return
 
 def set_frequency(pulse_gen, frequency, channel = 1, both = False):
@@ -196,27 +324,19 @@ def set_frequency(pulse_gen, frequency, channel = 1, both = False):
         pulse_gen (pyvisa.resources.gpib.GPIBInstrument): Tektronix AFG 3252
         frequency (str): Pulsewidth. Example '100khz'
         channel (int): Which channel.
-        both (bool): Set for both channels. 
-
-    """   
+        both (bool): Set for both channels.
 
-    # f = frequency.lower()
-    f = frequency
-    f_number, f_suffix = get_number_and_suffix(f) 
-    f = str(f_number) + freq_mapper[f_suffix]
-
-    if both:
-        pulse_gen.write('SOURce1:FREQuency {}'.format(f))
-        pulse_gen.write('SOURce2:FREQuency {}'.format(f))
-    else:
-        pulse_gen.write('SOURce{}:FREQuency {}'.format(channel, f))
+    """
 
+    f = _to_sci_str(frequency, 'frequency')
+    _write(pulse_gen, *_commands('frequency', channel, both, f))
+    _remember(pulse_gen, 'frequency', None, channel, both)
     return
 
 
 def trigger(pulse_gen,):
     """Manual trigger for the 3252.
-    
+
     args:
         pulse_gen (pyvisa.resources.gpib.GPIBInstrument): Tektronix AFG 3252
     """
@@ -235,14 +355,9 @@ def set_run_mode_to_burst(pulse_gen, channel=1, both=False):
         both (bool): Set both channels to burst
 
     """
-    if type(channel) != int:
-        raise TypeError('channel must be type int. Recieved type: {}'.format(type(channel)))
+    _check_channel(channel)
 
-    if both:
-        pulse_gen.write('source1:burst:state on')
-        pulse_gen.write('source2:burst:state on')
-    else:
-        pulse_gen.write('source{}:burst:state on'.format(channel))
+    _write(pulse_gen, *_commands('burst_on', channel, both))
     return
 
 
@@ -256,14 +371,9 @@ def set_burst_mode_off(pulse_gen, channel=1, both=False):
         both (bool): Set both channels to burst
 
     """
-    if type(channel) != int:
-        raise TypeError('channel must be type int. Recieved type: {}'.format(type(channel)))
+    _check_channel(channel)
 
-    if both:
-        pulse_gen.write('source1:burst:state off')
-        pulse_gen.write('source2:burst:state off')
-    else:
-        pulse_gen.write('source{}:burst:state off'.format(channel))
+    _write(pulse_gen, *_commands('burst_off', channel, both))
     return
 
 
@@ -278,14 +388,9 @@ def set_ncylces_for_burst_mode(pulse_gen, ncycles=1, channel=1, both=False):
         both (bool): Set both channels
 
     """
-    if type(channel) != int:
-        raise TypeError('channel must be type int. Recieved type: {}'.format(type(channel)))
+    _check_channel(channel)
 
-    if both:
-        pulse_gen.write('source1:burst:ncycles {}'.format(ncycles))
-        pulse_gen.write('source2:burst:ncycles {}'.format(ncycles))
-    else:
-        pulse_gen.write('source{}:burst:ncycles {}'.format(channel, ncycles))
+    _write(pulse_gen, *_commands('ncycles', channel, both, ncycles))
     return
 
 def set_function_to_pulse(pulse_gen, channel=1, both=False):
@@ -298,14 +403,10 @@ def set_function_to_pulse(pulse_gen, channel=1, both=False):
         both (bool): Set both channels
 
     """
-    if type(channel) != int:
-        raise TypeError('channel must be type int. Recieved type: {}'.format(type(channel)))
+    _check_channel(channel)
 
-    if both:
-        pulse_gen.write('source1:function:shape pulse')
-        pulse_gen.write('source2:function:shape pulse')
-    else:
-        pulse_gen.write('source{}:function:shape pulse'.format(channel))
+    _write(pulse_gen, *_commands('pulse', channel, both))
+    _forget(pulse_gen, channel, both)
     return
 
 def set_function_to_sine(pulse_gen, channel=1, both=False):
@@ -318,14 +419,10 @@ def set_function_to_sine(pulse_gen, channel=1, both=False):
         both (bool): Set both channels
 
     """
-    if type(channel) != int:
-        raise TypeError('channel must be type int. Recieved type: {}'.format(type(channel)))
+    _check_channel(channel)
 
-    if both:
-        pulse_gen.write('source1:function:shape sin')
-        pulse_gen.write('source2:function:shape sin')
-    else:
-        pulse_gen.write('source{}:function:shape sin'.format(channel))
+    _write(pulse_gen, *_commands('sine', channel, both))
+    _forget(pulse_gen, channel, both)
     return
 
 
@@ -339,38 +436,33 @@ def set_function_to_ramp(pulse_gen, channel=1, both=False):
         both (bool): Set both channels
 
     """
-    if type(channel) != int:
-        raise TypeError('channel must be type int. Recieved type: {}'.format(type(channel)))
+    _check_channel(channel)
 
-    if both:
-        pulse_gen.write('source1:function:shape ramp')
-        pulse_gen.write('source2:function:shape ramp')
-    else:
-        pulse_gen.write('source{}:function:shape ramp'.format(channel))
+    _write(pulse_gen, *_commands('ramp', channel, both))
+    _forget(pulse_gen, channel, both)
     return
 
-def set_offset(pulse_gen, offset = '0 mV', channel = 1, both = False):
+def set_offset(pulse_gen, offset = '0 mV', channel = 1, both = False, force = False):
     """
-    Set offset. 
+    Set offset.
 
     args:
         pulse_gen (pyvisa.resources.gpib.GPIBInstrument): Tektronix AFG 3252
         offset (str): Offset
         channel (int): 1 or 2. Which channel
         both (bool): Set both channels
+        force (bool): Write even if value is the same as the last value sent by this module (e.g. after a reset or front panel change).
 
     """
-    if type(channel) != int:
-        raise TypeError('channel must be type int. Recieved type: {}'.format(type(channel)))
+    _check_channel(channel)
 
-    if both:
-        pulse_gen.write('source1:voltage:level:IMMediate:offset {}'.format(offset))
-        pulse_gen.write('source2:voltage:level:IMMediate:offset {}'.format(offset))
-    else:
-        pulse_gen.write('source{}:voltage:level:IMMediate:offset {}'.format(channel, offset))
+    if not force and _unchanged(pulse_gen, 'offset', offset, channel, both):
+        return
+    _write(pulse_gen, *_commands('offset', channel, both, offset))
+    _remember(pulse_gen, 'offset', offset, channel, both)
     return
 
-def set_polarity(pulse_gen, inverted = False, channel = 1, both = False):
+def set_polarity(pulse_gen, inverted = False, channel = 1, both = False, force = False):
     """Set the polarity of the channel.
 
     args:
@@ -378,18 +470,17 @@ def set_polarity(pulse_gen, inverted = False, channel = 1, both = False):
         inverted (bool): Invert.
         channel (int): 1 or 2. Which channel
         both (bool): Set both channels
+        force (bool): Write even if value is the same as the last value sent by this module (e.g. after a reset or front panel change).
     """
-    if type(channel) != int:
-        raise TypeError('channel must be type int. Recieved type: {}'.format(type(channel)))
+    _check_channel(channel)
 
     if inverted:
         polarity = 'inv'
     else:
         polarity = 'norm'
 
-    if both:
-        pulse_gen.write('output1:polarity {}'.format(polarity))
-        pulse_gen.write('output2:polarity {}'.format(polarity))
-    else:
-        pulse_gen.write('output{}:polarity {}'.format(channel, polarity))
-    return
\ No newline at end of file
+    if not force and _unchanged(pulse_gen, 'polarity', polarity, channel, both):
+        return
+    _write(pulse_gen, *_commands('polarity', channel, both, polarity))
+    _remember(pulse_gen, 'polarity', polarity, channel, both)
+    return
@@ -1,13 +1,38 @@
 from IPython import display
+import time
+import weakref
 
 __all__ = ('update_plot', )
 
-def update_plot(fig):
-    """Interactively update fig in Jupyter notebook.
-    
+# id(fig) -> (weakref to fig, display handle, time of last update)
+_display_handles = {}
+
+def update_plot(fig, min_interval=0, force=False):
+    """Interactively update fig in Jupyter notebook. The figure is displayed once and then updated in place.
+
     args:
         fig (matplotlib.figure.Figure): updated figure to replot
+        min_interval (float): Minimum time (s) between redraws, off by default. Calls within min_interval of the last redraw are
+                              skipped, so when using it call with force=True after the last update or the final frame may not be shown.
+        force (bool): Redraw regardless of min_interval (e.g. for the final frame).
     """
-    display.clear_output(wait=True)
-    display.display(fig)
-    return 
\ No newline at end of file
+    now = time.monotonic()
+    entry = _display_handles.get(id(fig))
+    if entry is None or entry[0]() is not fig:
+        # forget figures that have been closed and collected
+        for key in [key for key, (ref, _, _) in _display_handles.items() if ref() is None]:
+            del _display_handles[key]
+        handle = display.display(fig, display_id=True)
+        _display_handles[id(fig)] = (weakref.ref(fig), handle, now)
+        return
+
+    fig_ref, handle, last_update = entry
+    if not force and now - last_update < min_interval:
+        return
+    if handle is None:
+        # not running under an IPython kernel, nothing to update in place
+        display.display(fig)
+    else:
+        handle.update(fig)
+    _display_handles[id(fig)] = (fig_ref, handle, now)
+    return
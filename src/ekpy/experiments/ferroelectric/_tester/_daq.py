@@ -301,8 +301,7 @@ class RUN():
 			self.get_df(self)
 			
 		#check if file name exists:
-		file_set = set(os.listdir(path))
-		if name in file_set:
+		if os.path.exists(os.path.join(path, name)):
 			yn = input('file already exists. Overwrite? (y/n)')
 			if yn == 'y':
 				self.data.to_csv(path+name, index = False)
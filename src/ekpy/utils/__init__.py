@@ -1,2 +1,3 @@
 from .core import *
-from .save import *
\ No newline at end of file
+from .save import *
+from .scpi import *
\ No newline at end of file
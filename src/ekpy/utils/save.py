@@ -13,15 +13,11 @@ def write_ekpy_data(fname:str, data:'pandas.DataFrame', meta_data:dict):
 		meta_data (dict): Meta data
 
 	"""
-	header = 'ekpy_heading{}'.format(os.linesep)
-	for key in meta_data:
-		header+='{}:::{}{}'.format(key, meta_data[key], os.linesep)
-	header+='ekpy_heading_complete{}'.format(os.linesep)    
-
-	data_to_write=data.to_csv(index=False)
-	to_write=(header+data_to_write).replace('\r\n', '\n')
-	with open(fname, 'w', newline=os.linesep) as f:
-		f.write(to_write)
+	# every line ends with os.linesep, the default line terminator of to_csv, so the file is opened without newline translation
+	# and to_csv writes straight into it instead of building the whole csv as one string first
+	with open(fname, 'w', newline='') as f:
+		f.write(os.linesep.join(['ekpy_heading'] + ['{}:::{}'.format(key, meta_data[key]) for key in meta_data] + ['ekpy_heading_complete', '']))
+		data.to_csv(f, index=False)
 	return
 
 def read_ekpy_data(file:str, skiprows:'int or None'=None, return_meta_data=False, return_skiprows=False):
@@ -40,52 +36,56 @@ def read_ekpy_data(file:str, skiprows:'int or None'=None, return_meta_data=False
 		(pandas.DataFrame, [Optional] dict, [Optional] int): (Data, meta_data, n_skiprows)
 	"""
 	if skiprows is not None:
-		return pd.read_csv(file, skip_blank_lines=True, skiprows=skiprows)
+		return pd.read_csv(file, skip_blank_lines=True, skiprows=skiprows, engine='c', memory_map=True)
 
 	# if skiprows is None:
+	# only the heading is read line by line, the data is parsed by pandas from the same handle right after it
 	with open(file, 'r') as f:
-		lines = f.readlines()
-	index=len(lines)+1
-	for i, line in enumerate(lines):
-		if i == 0 and 'ekpy_heading' not in line:
-			break
-		if 'ekpy_heading_complete' not in line:
-			continue
-		else:
-			index=i
+		lines = []
+		complete = False
+		line = f.readline()
+		if 'ekpy_heading' in line:
+			while line != '' and not complete:
+				lines.append(line)
+				complete = 'ekpy_heading_complete' in line
+				if not complete:
+					line = f.readline()
 
-	if index>len(lines):
-		if return_meta_data:
-			raise ValueError('Failed to find end of ekpy heading. Considering trying again with return_meta_data set to False?')
-		else:
+		if not complete:
+			if return_meta_data:
+				raise ValueError('Failed to find end of ekpy heading. Considering trying again with return_meta_data set to False?')
+			# no heading, so the whole file is csv and can be memory mapped
 			if return_skiprows:
-				return pd.read_csv(file), 0 # skip no rows
+				return pd.read_csv(file, engine='c', memory_map=True), 0 # skip no rows
 			else:
-				return pd.read_csv(file)
-		
+				return pd.read_csv(file, engine='c', memory_map=True)
+
+		# not memory mapped, a map would start at the top of the file rather than after the heading
+		data = pd.read_csv(f, skip_blank_lines=True, engine='c')
 	if not return_meta_data:
 		if return_skiprows:
-			return pd.read_csv(file, skip_blank_lines=True, skiprows=index+1), index+1
+			return data, len(lines)
 		else:
-			return pd.read_csv(file, skip_blank_lines=True, skiprows=index+1)
+			return data
 	else:
 		if return_skiprows:
-			return pd.read_csv(file, skip_blank_lines=True, skiprows=index+1), _parse_ekpy_meta_data(lines), index+1
+			return data, _parse_ekpy_meta_data(lines), len(lines)
 		else:
-			return pd.read_csv(file, skip_blank_lines=True, skiprows=index+1), _parse_ekpy_meta_data(lines)
+			return data, _parse_ekpy_meta_data(lines)
 
 def _parse_ekpy_meta_data(lines:list):
 	"""Parse ekpy_heading."""
 	meta_data = {}
 	for line in lines:
-		if 'ekpy_heading_complete' in line:
+		line = line.rstrip('\r\n')
+		# compared whole so a meta data key or value containing 'ekpy_heading' is not skipped
+		if line == 'ekpy_heading_complete':
 			break
-		if 'ekpy_heading' in line:
-			continue
-		if line == '\n' or line == '\r' or line == '\r\n':
+		if line == '' or line == 'ekpy_heading':
 			continue
-		spl=line.replace('\n', '').replace('\r', '').split(':::')
-		meta_data.update({spl[0]:spl[1]})
+		key, sep, value = line.partition(':::')
+		if sep:
+			meta_data[key] = value
 	return meta_data
 
 def _create_target_dir(target):
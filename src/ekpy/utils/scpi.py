@@ -0,0 +1,194 @@
+import re
+
+__all__ = ('join_scpi', 'SCPIBatch', 'SCPIShadow')
+
+_MNEMONIC_RE = re.compile(r'([A-Z]+)(\d*)')
+_SUFFIX_RE = re.compile(r'(?<=[A-Z])\d+')
+
+# short header -> settings the instrument changes when it is set, <n> is the header's numeric suffix (e.g. the channel).
+# Defaults are for the Keysight DSOX3024a: range and scale rewrite each other (and can clamp the offset), the probe rescales all three
+_COUPLED_SETTINGS = {
+    'CHAN<n>:RANG':('CHAN<n>:SCAL', 'CHAN<n>:OFFS'),
+    'CHAN<n>:SCAL':('CHAN<n>:RANG', 'CHAN<n>:OFFS'),
+    'CHAN<n>:PROB':('CHAN<n>:RANG', 'CHAN<n>:SCAL', 'CHAN<n>:OFFS'),
+    'TIM:RANG':('TIM:SCAL',),
+    'TIM:SCAL':('TIM:RANG',),
+}
+
+
+def join_scpi(commands):
+    """Join SCPI commands into a single compound command. Each command is made root relative (leading ':'),
+    common commands (e.g. '*CLS') are left as is.
+
+    args:
+        commands (array-like): SCPI commands (str)
+
+    returns:
+        (str): Compound command
+
+    examples:
+        ```
+        >>> join_scpi([':OUTP1:IMP 50', 'OUTP1:IMP:EXT 50', '*CLS'])
+        > ':OUTP1:IMP 50;:OUTP1:IMP:EXT 50;*CLS'
+        ```
+
+    """
+    return ';'.join(command if command.startswith(('*', ':')) else ':' + command for command in commands)
+
+
+class SCPIBatch():
+    """Accumulate SCPI writes and send them to the instrument as one compound command (a single write) on exit.
+    An SCPIBatch can be passed in place of the instrument to functions which only write to it.
+
+    args:
+        inst (pyvisa.resources.Resource): Instrument
+
+    examples:
+
+        .. code-block:: python
+
+            from ekpy.utils import SCPIBatch
+            from ekpy.control.instruments import keysight81150a
+
+            with SCPIBatch(wavegen) as batch:
+                keysight81150a.configure_impedance(batch, '1')
+                keysight81150a.configure_trigger(batch, '1', source='MAN')
+            # both functions' commands are sent in a single write here
+
+    """
+
+    def __init__(self, inst):
+        self.inst = inst
+        self.commands = []
+
+    def write(self, command):
+        """Queue command to be sent on flush."""
+        self.commands.append(command)
+
+    def flush(self):
+        """Send the queued commands as one compound command."""
+        if len(self.commands) != 0:
+            self.inst.write(join_scpi(self.commands))
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            # do not send a partial sequence
+            self.commands = []
+        return False
+
+
+class SCPIShadow():
+    """Wrap an instrument, remember the last value written to each setting and drop writes that would set the value the
+    instrument already has, e.g. the same :ACQuire:TYPE sent on every step of a sweep. Everything but write is passed
+    through to the instrument, so an SCPIShadow can be used in place of the instrument.
+
+    Headers are compared by their short form so :ACQuire:TYPE and :ACQ:TYPE are the same setting, values are compared as
+    written. Only writes sent through the shadow are tracked: common commands (e.g. '*RST') and the headers in resets
+    clear it, setting a header in coupled forgets the settings it changes, call clear() after changing the instrument any
+    other way (front panel, another resource). Commands without
+    a value, queries and the headers in actions are always sent, as is any command a relative header later in the same compound
+    command (e.g. 'RANG 2' in ':TIM:SCAL 1;RANG 2') depends on.
+
+    args:
+        inst (pyvisa.resources.Resource): Instrument
+        actions (array-like): Headers which take a value but do something rather than set it, always sent
+        resets (array-like): Headers which change other settings as a side effect, sent and the shadow cleared
+        coupled (dict): Short header -> short headers of the settings it changes, forgotten when it is set. <n> stands for
+                        the numeric suffix, e.g. {'CHAN<n>:RANG': ('CHAN<n>:SCAL',)}
+
+    examples:
+
+        .. code-block:: python
+
+            from ekpy.utils import SCPIShadow
+            from ekpy.control.instruments import keysightdsox3024a
+
+            shadow = SCPIShadow(scope)
+            for delay in delays:
+                ... # change the delay on the pulse generator
+                data = keysightdsox3024a.acquire(shadow, '1') # the acquisition and waveform settings are only sent the first time
+
+    """
+
+    _attributes = ('inst', 'actions', 'resets', 'coupled', 'settings')
+
+    def __init__(self, inst, actions=(':DIGitize', ':DATA:COPY'), resets=(':AUToscale',), coupled=_COUPLED_SETTINGS):
+        self.inst = inst
+        self.actions = {_short_header(header) for header in actions}
+        self.resets = {_short_header(header) for header in resets}
+        self.coupled = dict(coupled)
+        self.settings = {}
+
+    def write(self, command):
+        """Write command without the settings that already have the value."""
+        parts = [part.strip() for part in command.split(';') if part.strip() != '']
+        #a header without a leading ':' after the first command is relative to the header before it, those are not tracked
+        relative = [i != 0 and not part.startswith((':', '*')) for i, part in enumerate(parts)]
+        commands = []
+        for i, part in enumerate(parts):
+            if part.startswith('*'):
+                self.settings.clear()
+                commands.append(part)
+                continue
+            header, _, value = part.partition(' ')
+            value = value.strip()
+            key = None if relative[i] else _short_header(header)
+            #common commands leave the header path alone, so the next command which is not one is what could be relative to this
+            following = next((j for j in range(i + 1, len(parts)) if not parts[j].startswith('*')), None)
+            anchors_next = following is not None and relative[following]
+            if key in self.resets:
+                self.settings.clear()
+            elif key is None or value == '' or key in self.actions:
+                pass
+            elif self.settings.get(key) == value and not anchors_next:
+                continue
+            else:
+                self._forget_coupled(key)
+                self.settings[key] = value
+            commands.append(part)
+        if len(commands) != 0:
+            return self.inst.write(';'.join(commands))
+
+    def clear(self):
+        """Forget the shadowed settings, the next write of each is sent."""
+        self.settings = {}
+
+    def _forget_coupled(self, key):
+        """Forget the shadowed settings which setting key changes."""
+        suffix = _SUFFIX_RE.search(key)
+        for coupled in self.coupled.get(_SUFFIX_RE.sub('<n>', key), ()):
+            self.settings.pop(coupled.replace('<n>', suffix.group() if suffix is not None else ''), None)
+
+    def __getattr__(self, name):
+        if name == 'write_raw':
+            #raw writes would change settings without the shadow seeing them, functions which use write_raw fall back to write
+            raise AttributeError(name)
+        return getattr(self.inst, name)
+
+    def __setattr__(self, name, value):
+        #e.g. shadow.timeout = 5000 sets the instrument's timeout
+        if name in self._attributes:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.inst, name, value)
+
+
+def _short_header(header):
+    """Returns header in short form (':ACQuire:TYPE' -> 'ACQ:TYPE'), or None if it is not a plain header (e.g. a query)."""
+    mnemonics = []
+    for mnemonic in header.strip().lstrip(':').upper().split(':'):
+        match = _MNEMONIC_RE.fullmatch(mnemonic)
+        if match is None:
+            return None
+        letters, suffix = match.groups()
+        #the SCPI short form is the first four letters, or three if the fourth is a vowel
+        if len(letters) > 4:
+            letters = letters[:3] if letters[3] in 'AEIOU' else letters[:4]
+        mnemonics.append(letters + suffix)
+    return ':'.join(mnemonics)
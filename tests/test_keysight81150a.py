@@ -0,0 +1,35 @@
+import unittest
+
+import numpy as np
+
+from ekpy.control.instruments.keysight81150a import core as keysight81150a
+
+
+class FakeWavegen():
+    """Records everything written to it."""
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, command):
+        self.written.append(command)
+
+
+class TestCreateArbWf(unittest.TestCase):
+
+    def test_full_precision(self):
+        data = np.array([0.123456789012, -1/3, 1e-9, 0.5])
+        wavegen = FakeWavegen()
+        keysight81150a.create_arb_wf(wavegen, data)
+        self.assertEqual(wavegen.written, [":DATA VOLATILE, " + ','.join(str(value) for value in data)])
+        values = np.array(wavegen.written[0].split(', ', 1)[1].split(','), dtype=np.float64)
+        np.testing.assert_array_equal(values, data)
+
+    def test_list_and_name(self):
+        wavegen = FakeWavegen()
+        keysight81150a.create_arb_wf(wavegen, [1, 0.25, -1], name='ARB1')
+        self.assertEqual(wavegen.written, [":DATA VOLATILE, 1,0.25,-1", ":DATA:COPY ARB1, VOLATILE"])
+
+
+if __name__ == '__main__':
+    unittest.main()
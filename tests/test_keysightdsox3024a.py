@@ -0,0 +1,80 @@
+import unittest
+
+import numpy as np
+import pyvisa
+
+from ekpy.utils import SCPIBatch, SCPIShadow
+from ekpy.control.instruments.keysightdsox3024a import core as keysightdsox3024a
+
+
+class FakeScope():
+    """Records writes and the timeout each query was made with."""
+
+    def __init__(self, time_out=False):
+        self.timeout = 2000
+        self.time_out = time_out
+        self.written = []
+        self.queries = []
+        self.cleared = False
+
+    def write(self, command):
+        self.written.append(command)
+
+    def query(self, command):
+        self.queries.append((command, self.timeout))
+        if self.time_out:
+            raise pyvisa.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+        return '1'
+
+    def clear(self):
+        self.cleared = True
+
+
+class TestWaitForOPC(unittest.TestCase):
+
+    def test_timeout_set_on_wrapped_resource(self):
+        for wrapper in (SCPIShadow, SCPIBatch):
+            scope = FakeScope()
+            keysightdsox3024a.wait_for_opc(wrapper(scope), timeout=10)
+            self.assertEqual(scope.queries, [('*OPC?', 10)])
+            self.assertEqual(scope.timeout, 2000)
+
+    def test_wait_for_acq_complete_wrapped(self):
+        scope = FakeScope()
+        keysightdsox3024a.wait_for_acq_complete(SCPIShadow(scope), timeout=5)
+        self.assertEqual(scope.written, ['*CLS'])
+        self.assertEqual(scope.queries, [('*OPC?', 50)])
+        self.assertEqual(scope.timeout, 2000)
+
+    def test_timed_out_query_clears_the_resource(self):
+        scope = FakeScope(time_out=True)
+        with self.assertRaises(pyvisa.VisaIOError):
+            keysightdsox3024a.wait_for_opc(SCPIShadow(scope), timeout=10)
+        self.assertTrue(scope.cleared)
+        self.assertEqual(scope.timeout, 2000)
+
+
+@unittest.skipIf(keysightdsox3024a._scale_kernel is None, 'numba is not installed')
+class TestScale(unittest.TestCase):
+
+    def _numpy_scale(self, *args):
+        kernel = keysightdsox3024a._scale_kernel
+        keysightdsox3024a._scale_kernel = None
+        try:
+            return keysightdsox3024a._scale(*args)
+        finally:
+            keysightdsox3024a._scale_kernel = kernel
+
+    def test_numba_matches_numpy(self):
+        rng = np.random.default_rng(0)
+        for raw_dtype in (np.int8, np.int16, np.uint16, np.float64):
+            raw = rng.integers(-100, 100, size=10001).astype(raw_dtype)
+            for dtype in (np.float32, np.float64):
+                for y_reference, y_increment, y_origin in ((0, 7.8125e-04, 0.15), (np.float64(128), np.float64(3.2e-3), np.float64(-1.234567))):
+                    expected = self._numpy_scale(raw, y_reference, y_increment, y_origin, np.empty(raw.shape, dtype))
+                    result = keysightdsox3024a._scale(raw, y_reference, y_increment, y_origin, np.empty(raw.shape, dtype))
+                    np.testing.assert_array_equal(result, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
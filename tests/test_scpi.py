@@ -0,0 +1,62 @@
+import unittest
+
+from ekpy.utils import SCPIShadow
+
+
+class FakeInstrument():
+    """Records everything written to it."""
+
+    def __init__(self):
+        self.written = []
+        self.timeout = 2000
+
+    def write(self, command):
+        self.written.append(command)
+
+
+class TestSCPIShadow(unittest.TestCase):
+
+    def setUp(self):
+        self.inst = FakeInstrument()
+        self.shadow = SCPIShadow(self.inst)
+
+    def test_unchanged_setting_not_sent(self):
+        self.shadow.write(':ACQuire:TYPE NORMal')
+        self.shadow.write(':ACQ:TYPE NORMal')
+        self.assertEqual(self.inst.written, [':ACQuire:TYPE NORMal'])
+
+    def test_range_invalidates_scale(self):
+        # the range rewrites the scale, so setting the scale back must be sent
+        for command in (':CHAN1:SCAL 0.1', ':CHAN1:RANG 8', ':CHAN1:SCAL 0.1'):
+            self.shadow.write(command)
+        self.assertEqual(self.inst.written, [':CHAN1:SCAL 0.1', ':CHAN1:RANG 8', ':CHAN1:SCAL 0.1'])
+
+    def test_probe_invalidates_only_its_channel(self):
+        for command in (':CHAN1:SCAL 0.1', ':CHAN2:SCAL 0.1', ':CHANnel2:PROBe 10', ':CHAN1:SCAL 0.1', ':CHAN2:SCAL 0.1'):
+            self.shadow.write(command)
+        self.assertEqual(self.inst.written, [':CHAN1:SCAL 0.1', ':CHAN2:SCAL 0.1', ':CHANnel2:PROBe 10', ':CHAN2:SCAL 0.1'])
+
+    def test_timebase_range_and_scale_invalidate_each_other(self):
+        for command in (':TIM:SCAL 1', ':TIMebase:RANGe 2', ':TIM:SCAL 1'):
+            self.shadow.write(command)
+        self.assertEqual(self.inst.written, [':TIM:SCAL 1', ':TIMebase:RANGe 2', ':TIM:SCAL 1'])
+
+    def test_relative_header_keeps_its_anchor(self):
+        self.shadow.write(':TIM:SCAL 1;RANG 2')
+        self.shadow.write(':TIM:SCAL 1;RANG 2')
+        self.assertEqual(self.inst.written, [':TIM:SCAL 1;RANG 2', ':TIM:SCAL 1;RANG 2'])
+
+    def test_common_command_clears(self):
+        self.shadow.write(':ACQ:TYPE NORM')
+        self.shadow.write('*RST')
+        self.shadow.write(':ACQ:TYPE NORM')
+        self.assertEqual(self.inst.written, [':ACQ:TYPE NORM', '*RST', ':ACQ:TYPE NORM'])
+
+    def test_attributes_set_on_instrument(self):
+        self.shadow.timeout = 10
+        self.assertEqual(self.inst.timeout, 10)
+        self.assertNotIn('timeout', vars(self.shadow))
+
+
+if __name__ == '__main__':
+    unittest.main()